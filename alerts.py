@@ -0,0 +1,236 @@
+# alerts.py
+import logging
+import os
+import re
+import time
+from collections import Counter
+from datetime import datetime
+
+from geo import GeoIndex
+from history import IST
+from markers import MarkerColumns
+from serializer import dumps
+
+logger = logging.getLogger(__name__)
+
+ALERT_LEVELS = ('No Warning', 'Watch', 'Alert', 'Warning')
+
+# Snapshot versions kept in the change log served by /alerts/changes
+ALERTS_CHANGELOG_SIZE = int(os.getenv('ALERTS_CHANGELOG_SIZE', 100))
+
+
+# Date formats seen in the page's "Last Updated" text
+_LAST_UPDATED = re.compile(r'(\d{1,2})[-/.](\d{1,2}|[A-Za-z]{3})[-/.](\d{4})\D+(\d{1,2}):(\d{2})')
+
+
+def parse_last_updated(text):
+    """Epoch seconds of an IMD "Last Updated: 17-10-2026 13:45 IST" string, or None"""
+    match = _LAST_UPDATED.search(text or '')
+    if not match:
+        return None
+    day, month, year, hour, minute = match.groups()
+    try:
+        month = int(month) if month.isdigit() else datetime.strptime(month.title(), '%b').month
+        return datetime(int(year), month, int(day), int(hour), int(minute), tzinfo=IST).timestamp()
+    except ValueError:
+        return None
+
+
+class AlertsSnapshot:
+    """
+    One parsed copy of the nowcast alerts page with everything the /alerts
+    endpoints need precomputed. Snapshots are never mutated after they are
+    built; a refresh builds a new one and swaps it in.
+
+    Given the `previous` snapshot, only the states with changed alerts are
+    regrouped and re-encoded, the level counts are adjusted by the changed
+    alerts alone, and an unchanged page keeps the previous version.
+
+    `version` defaults to the fetch time in milliseconds; pass one shared
+    by every process (bl keeps it in the snapshot store) so that ETags and
+    /alerts/changes agree across workers.
+    """
+
+    def __init__(self, data, fetched_at=None, previous=None, version=None):
+        self.data = data
+        self.built_at = time.time()
+        self.fetched_at = fetched_at or self.built_at
+        self.version = version or int(self.fetched_at * 1000)
+        self.last_updated = data.get('last_updated')
+        self.last_modified = parse_last_updated(self.last_updated) or self.fetched_at
+        self.alerts = data.get('alerts', [])
+        self.keyed = _keyed(self.alerts)
+
+        if previous is None:
+            self.changes = None
+            self.changelog = ()
+            self._build()
+            return
+
+        self.changes = _diff(previous.keyed, self.keyed)
+        if not self.changes and self.last_updated == previous.last_updated and version in (None, previous.version):
+            self._reuse(previous)
+            return
+        self._build(previous)
+        entry = {
+            'from_version': previous.version,
+            'version': self.version,
+            'last_updated': self.last_updated,
+            'states': self.changes
+        }
+        self.changelog = (previous.changelog + (entry,))[-ALERTS_CHANGELOG_SIZE:]
+
+    def _build(self, previous=None):
+        self.columns = MarkerColumns.from_alerts(self.alerts)
+        self.geo = GeoIndex(self.columns.lat, self.columns.lng)
+
+        # State lookups are case-insensitive
+        grouped = {}
+        for state, state_alerts in self.data.get('alerts_by_state', {}).items():
+            grouped.setdefault(state.lower(), []).extend(state_alerts)
+
+        if previous is None:
+            levels = Counter(self.columns.level)
+            self.by_state = grouped
+            changed = set(grouped)
+        else:
+            levels = Counter(previous.level_counts)
+            for changes in self.changes.values():
+                for alert in changes['added']:
+                    levels[alert.get('alert_level', 'Unknown')] += 1
+                for alert in changes['removed']:
+                    levels[alert.get('alert_level', 'Unknown')] -= 1
+                for alert in changes['level_changed']:
+                    levels[alert['previous_level']] -= 1
+                    levels[alert.get('alert_level', 'Unknown')] += 1
+            # Groups of states without changes are the previous snapshot's lists.
+            # Change keys are the grouping states (see _alert_key), keyed as grouped
+            changed = {state.lower() for state in self.changes}
+            self.by_state = {
+                state: state_alerts if state in changed else previous.by_state.get(state, state_alerts)
+                for state, state_alerts in grouped.items()
+            }
+        self.level_counts = {level: levels.get(level, 0) for level in ALERT_LEVELS}
+
+        self.summary = {
+            'total_alerts': len(self.alerts),
+            'states_affected': len(self.data.get('alerts_by_state', {})),
+            'alert_levels': self.level_counts,
+            'last_updated': self.last_updated,
+            'timestamp': datetime.fromtimestamp(self.built_at).isoformat()
+        }
+
+        self.alerts_json = dumps({'code': 200, 'result': {**self.data, 'version': self.version}})
+        self.summary_json = dumps({'code': 200, 'result': self.summary})
+        # State bodies carry last_updated, so all are re-encoded when it moves
+        if previous is not None and self.last_updated == previous.last_updated:
+            self.state_json = {
+                state: previous.state_json[state] if state not in changed else self._encode_state(state)
+                for state in self.by_state
+            }
+        else:
+            self.state_json = {state: self._encode_state(state) for state in self.by_state}
+
+    def _reuse(self, previous):
+        """Share everything precomputed from an identical previous page"""
+        # The alerts too: the geo index and columns hold positions into them
+        for name in ('data', 'alerts', 'keyed', 'version', 'columns', 'geo', 'level_counts', 'by_state', 'summary',
+                     'alerts_json', 'summary_json', 'state_json', 'changelog'):
+            setattr(self, name, getattr(previous, name))
+
+    def _encode_state(self, state):
+        return dumps({'code': 200, 'result': self.state_result(state)})
+
+    def state_result(self, state):
+        state_alerts = self.by_state.get(state, [])
+        return {
+            'state': state,
+            'alerts': state_alerts,
+            'total_alerts': len(state_alerts),
+            'last_updated': self.last_updated
+        }
+
+    def changes_since(self, version):
+        """
+        Change log entries after `version`, oldest first, or None if
+        `version` is older than the log (or unknown) and the client has to
+        fetch /alerts again.
+        """
+        if version == self.version:
+            return []
+        for index, entry in enumerate(self.changelog):
+            if entry['from_version'] == version:
+                return list(self.changelog[index:])
+        return None
+
+
+def _alert_key(alert):
+    # State first, defaulted as scraper.parse_alerts_page groups alerts by_state
+    return alert.get('state', 'Unknown'), alert.get('location', ''), alert.get('warning_type', '')
+
+
+def _keyed(alerts):
+    """{identity: alert}; an identity repeated on the page is numbered by occurrence"""
+    keyed = {}
+    seen = Counter()
+    for alert in alerts:
+        key = _alert_key(alert)
+        keyed[key + (seen[key],)] = alert
+        seen[key] += 1
+    return keyed
+
+
+def _diff(old_keyed, new_keyed):
+    """Alerts added, removed, changed in level or otherwise updated, grouped by state"""
+    states = {}
+
+    def changes(state, kind):
+        return states.setdefault(state, {'added': [], 'removed': [], 'level_changed': [], 'updated': []})[kind]
+
+    for key, alert in new_keyed.items():
+        previous = old_keyed.get(key)
+        if previous is None:
+            changes(key[0], 'added').append(alert)
+        elif previous.get('alert_level') != alert.get('alert_level'):
+            changes(key[0], 'level_changed').append({**alert, 'previous_level': previous.get('alert_level')})
+        elif previous != alert:
+            changes(key[0], 'updated').append(alert)
+    for key, alert in old_keyed.items():
+        if key not in new_keyed:
+            changes(key[0], 'removed').append(alert)
+    return states
+
+
+def diff_snapshots(old, new):
+    """Changes from `old` to `new`, taken from `new`'s change log when it follows on from `old`"""
+    if old.version == new.version:
+        states = {}
+    elif new.changelog and new.changelog[-1]['from_version'] == old.version:
+        return new.changelog[-1]
+    else:
+        states = _diff(old.keyed, new.keyed)
+    return {
+        'from_version': old.version,
+        'version': new.version,
+        'last_updated': new.last_updated,
+        'states': states
+    }
+
+
+def build_snapshot(data, fetched_at=None, previous=None, version=None):
+    """
+    Build a snapshot from a scraper.get_alerts() result, passing errors
+    through. `previous`, the snapshot being replaced, makes the build
+    incremental.
+    """
+    if 'error' in data:
+        return data
+    if not isinstance(previous, AlertsSnapshot):
+        previous = None
+    snapshot = AlertsSnapshot(data, fetched_at, previous, version)
+    if snapshot.changes is None:
+        logger.info("Built alerts snapshot with %s alerts", snapshot.summary['total_alerts'])
+    elif snapshot.version != previous.version:
+        logger.info("Built alerts snapshot version %s with %s alerts, %s states changed",
+                    snapshot.version, snapshot.summary['total_alerts'], len(snapshot.changes))
+    return snapshot
@@ -1,110 +1,517 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, stream_with_context
 import bl
+import logs
+import metrics
+import ratelimit  # noqa: F401 (registers the sqlite:// rate limit storage)
+import serializer
+import stations
+import stream
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import waitress
 import os
 import logging
+import time
+from datetime import datetime
 
-# Set up logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Set up logging (LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE_RATE)
+logs.configure()
 logger = logging.getLogger(__name__)
 
 # Retrieve rate limit values from environment variables
 RATE_LIMIT_DAILY = int(os.getenv('RATE_LIMIT_DAILY', 1000))
 RATE_LIMIT_HOURLY = int(os.getenv('RATE_LIMIT_HOURLY', 100))
+DEFAULT_RATE_LIMIT = f"{RATE_LIMIT_DAILY} per day;{RATE_LIMIT_HOURLY} per hour"
+# Limits for routes answered from memory (station lookups, alerts snapshots);
+# routes that may call IMD use the daily and hourly limits above
+RATE_LIMIT_CACHED = os.getenv('RATE_LIMIT_CACHED', '20000 per day;2000 per hour')
+# 'sqlite://' shares counters between worker processes (see ratelimit.py),
+# 'memory://' keeps them per process
+RATE_LIMIT_STORAGE = os.getenv('RATE_LIMIT_STORAGE', 'sqlite://')
+
+# Default window for history requests without a start time
+HISTORY_DEFAULT_DAYS = int(os.getenv('HISTORY_DEFAULT_DAYS', 7))
+
+# Maximum number of stations in one batch weather request
+BATCH_MAX_IDS = int(os.getenv('BATCH_MAX_IDS', 100))
+
+# Limits on geospatial queries
+NEAREST_MAX_COUNT = int(os.getenv('NEAREST_MAX_COUNT', 50))
+GEO_MAX_RADIUS_KM = float(os.getenv('GEO_MAX_RADIUS_KM', 1000))
+
+# 'wsgi' serves with waitress, 'asgi' serves asgi.py with uvicorn
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+# Request threads per process under waitress and gunicorn.conf.py
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', 16))
+# Each open /alerts/stream client holds one of those threads, so at most
+# this many may stream (never all of them) and the rest serve other routes.
+# With a single thread this is 0 and the stream is refused
+ALERTS_STREAM_MAX_THREADED_CLIENTS = max(0, min(
+    int(os.getenv('ALERTS_STREAM_MAX_THREADED_CLIENTS', max(1, SERVER_THREADS // 2))),
+    SERVER_THREADS - 1
+))
 
 app = Flask(__name__)
 
 limiter = Limiter(
     key_func=get_remote_address,
-    default_limits=[
-        f"{RATE_LIMIT_DAILY} per day",
-        f"{RATE_LIMIT_HOURLY} per hour"
-    ]
+    default_limits=[DEFAULT_RATE_LIMIT],
+    storage_uri=RATE_LIMIT_STORAGE,
+    strategy='sliding-window-counter'
 )
 
 limiter.init_app(app)
 
+def route_limits(endpoint, default):
+    """RATE_LIMIT_<ENDPOINT> if set (e.g. RATE_LIMIT_GET_STATION='600 per minute'), else `default`"""
+    return os.getenv(f'RATE_LIMIT_{endpoint.upper()}', default)
+
+def _limit(default):
+    """Rate limit the decorated route with route_limits for its endpoint name"""
+    def decorator(fn):
+        return limiter.limit(route_limits(fn.__name__, default))(fn)
+    return decorator
+
+# Load the station registry once at startup rather than on every request
+try:
+    stations.load()
+except Exception as e:
+    logger.error("Error loading station registry: %s", e)
+
+# Start from the last published snapshots rather than empty caches
+bl.warm()
+
+# gunicorn.conf.py imports this module in the master before forking; threads
+# do not survive a fork, so it starts them in each worker (post_fork) instead
+if os.getenv('APP_PRELOADED') != '1':
+    bl.start_background_refresh()
+
+def _cached_response(validators, payload):
+    """Response for `payload` with compression and HTTP caching, see serializer.respond"""
+    route = request.url_rule.rule
+    with metrics.encode_seconds.time(route):
+        status, body, headers = serializer.respond(validators, payload, request.headers, route)
+    if status == 304:
+        return app.response_class(status=304, headers=headers)
+    return app.response_class(body, status=status, headers=headers, mimetype='application/json')
+
+@app.errorhandler(429)
+def rate_limit_exceeded(e):
+    metrics.rate_limited.inc(request.url_rule.rule if request.url_rule else request.path)
+    return e
+
+def _json_body(body, code):
+    return app.response_class(body, status=code, mimetype='application/json')
+
+def _coordinates(*names):
+    """Query arguments as floats; raises ValueError if one is missing or out of range"""
+    values = []
+    for name in names:
+        value = float(request.args[name]) if name in request.args else None
+        limit = 90 if 'lat' in name else 180
+        if value is None or not -limit <= value <= limit:
+            raise ValueError(name)
+        values.append(value)
+    return values
+
+@app.route('/station/nearest')
+@_limit(RATE_LIMIT_CACHED)
+def get_nearest_stations():
+    try:
+        logger.debug("Nearest stations request received for: %s, %s", request.args.get('lat'), request.args.get('lng'))
+        try:
+            lat, lng = _coordinates('lat', 'lng')
+            count = int(request.args.get('n', 5))
+        except ValueError:
+            return jsonify({
+                'code': 400,
+                'msg': 'lat and lng must be valid coordinates and n an integer'
+            }), 400
+        if not 1 <= count <= NEAREST_MAX_COUNT:
+            return jsonify({
+                'code': 400,
+                'msg': f'n must be between 1 and {NEAREST_MAX_COUNT}'
+            }), 400
+        result = bl.get_nearest_stations(lat, lng, count)
+        if result['code'] != 200:
+            return jsonify(result), result['code']
+        return _cached_response(bl.get_stations_validators(query=f'nearest-{lat}-{lng}-{count}'), result)
+    except Exception as e:
+        logger.error("Error in get_nearest_stations: %s", e)
+        return jsonify({
+            'code': 500,
+            'msg': 'Internal server error'
+        }), 500
+
 @app.route('/station/<string:id>')
+@_limit(RATE_LIMIT_CACHED)
 def get_station(id):
     try:
-        logger.debug(f"Station request received for ID: {id}")
+        logger.debug("Station request received for ID: %s", id)
         if id == 'all':
-            result = bl.get_all_stations()
-        else:
-            result = bl.get_station_by_id(int(id))
-        return jsonify(result), result['code']
+            body, code = bl.get_all_stations_json()
+            if code != 200:
+                return _json_body(body, code)
+            return _cached_response(bl.get_stations_validators(), body)
+        result = bl.get_station_by_id(int(id))
+        if result['code'] != 200:
+            return jsonify(result), result['code']
+        return _cached_response(bl.get_stations_validators(int(id)), result)
     except ValueError:
         return jsonify({
             'code': 400,
             'msg': 'Invalid station ID format'
         }), 400
     except Exception as e:
-        logger.error(f"Error in get_station: {str(e)}")
+        logger.error("Error in get_station: %s", e)
         return jsonify({
             'code': 500,
             'msg': 'Internal server error'
         }), 500
 
 @app.route('/weather/<int:id>')
+@_limit(DEFAULT_RATE_LIMIT)
 def get_station_weather(id):
     try:
-        logger.debug(f"Weather request received for station ID: {id}")
-        result = bl.get_station_weather(id)
+        logger.debug("Weather request received for station ID: %s", id)
+        result, validators = bl.get_station_weather(id)
+        if result['code'] != 200:
+            return jsonify(result), result['code']
+        return _cached_response(validators, result)
+    except Exception as e:
+        logger.error("Error in get_station_weather: %s", e)
+        return jsonify({
+            'code': 500,
+            'msg': 'Internal server error'
+        }), 500
+
+def _parse_time(value, default):
+    """Epoch seconds from an epoch number or an ISO date/datetime (IST if no offset is given)"""
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=bl.history.IST)
+    return parsed.timestamp()
+
+@app.route('/weather/<int:id>/history')
+@_limit(DEFAULT_RATE_LIMIT)
+def get_station_history(id):
+    try:
+        logger.debug("History request received for station ID: %s", id)
+        try:
+            end = _parse_time(request.args.get('end'), time.time())
+            start = _parse_time(request.args.get('start'), end - HISTORY_DEFAULT_DAYS * 86400)
+        except ValueError:
+            return jsonify({
+                'code': 400,
+                'msg': 'Invalid start or end time'
+            }), 400
+        resolution = request.args.get('resolution', 'raw')
+        result = bl.get_station_history(id, start, end, resolution)
+        if result['code'] != 200:
+            return jsonify(result), result['code']
+        return _cached_response(
+            bl.get_history_validators(id, start, end, resolution),
+            result
+        )
+    except Exception as e:
+        logger.error("Error in get_station_history: %s", e)
+        return jsonify({
+            'code': 500,
+            'msg': 'Internal server error'
+        }), 500
+
+def _batch_weather_response(ids):
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return jsonify({
+            'code': 400,
+            'msg': 'No station IDs given'
+        }), 400
+    if len(ids) > BATCH_MAX_IDS:
+        return jsonify({
+            'code': 400,
+            'msg': f'Too many station IDs, at most {BATCH_MAX_IDS} are allowed'
+        }), 400
+
+    stream = request.args.get('stream', '').lower() in ('1', 'true')
+    if stream or request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson':
+        def generate():
+            for id, result in bl.iter_bulk_station_weather(ids):
+                yield serializer.dumps({'stationId': id, **result})
+        return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    result, validators = bl.get_bulk_station_weather(ids)
+    if result['code'] != 200:
         return jsonify(result), result['code']
+    return _cached_response(validators, result)
+
+@app.route('/weather')
+@_limit(DEFAULT_RATE_LIMIT)
+def get_batch_weather():
+    try:
+        logger.debug("Batch weather request received for IDs: %s", request.args.get('ids'))
+        try:
+            ids = [int(id) for id in request.args.get('ids', '').split(',') if id.strip()]
+        except ValueError:
+            return jsonify({
+                'code': 400,
+                'msg': 'Invalid station ID format'
+            }), 400
+        return _batch_weather_response(ids)
+    except Exception as e:
+        logger.error("Error in get_batch_weather: %s", e)
+        return jsonify({
+            'code': 500,
+            'msg': 'Internal server error'
+        }), 500
+
+@app.route('/weather/region/<string:region>')
+@_limit(DEFAULT_RATE_LIMIT)
+def get_region_weather(region):
+    try:
+        logger.debug("Region weather request received for: %s", region)
+        result = bl.get_stations_by_region(region)
+        if result['code'] != 200:
+            return jsonify(result), result['code']
+        return _batch_weather_response([station['stationId'] for station in result['result']])
     except Exception as e:
-        logger.error(f"Error in get_station_weather: {str(e)}")
+        logger.error("Error in get_region_weather: %s", e)
         return jsonify({
             'code': 500,
             'msg': 'Internal server error'
         }), 500
 
 @app.route('/alerts')
+@_limit(RATE_LIMIT_CACHED)
 def get_all_alerts():
     try:
         logger.debug("Weather alerts request received")
-        result = bl.get_weather_alerts()
-        return jsonify(result), result['code']
+        body, code, validators = bl.get_weather_alerts_json()
+        if code != 200:
+            return _json_body(body, code)
+        return _cached_response(validators, body)
     except Exception as e:
-        logger.error(f"Error in get_all_alerts: {str(e)}")
+        logger.error("Error in get_all_alerts: %s", e)
         return jsonify({
             'code': 500,
             'msg': 'Internal server error'
         }), 500
 
 @app.route('/alerts/state/<string:state>')
+@_limit(RATE_LIMIT_CACHED)
 def get_state_alerts(state):
     try:
-        logger.debug(f"Weather alerts request received for state: {state}")
-        result = bl.get_state_alerts(state)
-        return jsonify(result), result['code']
+        logger.debug("Weather alerts request received for state: %s", state)
+        body, code, validators = bl.get_state_alerts_json(state)
+        if code != 200:
+            return _json_body(body, code)
+        return _cached_response(validators, body)
+    except Exception as e:
+        logger.error("Error in get_state_alerts: %s", e)
+        return jsonify({
+            'code': 500,
+            'msg': 'Internal server error'
+        }), 500
+
+@app.route('/alerts/nearby')
+@_limit(RATE_LIMIT_CACHED)
+def get_nearby_alerts():
+    try:
+        logger.debug("Nearby alerts request received for: %s, %s", request.args.get('lat'), request.args.get('lng'))
+        try:
+            lat, lng = _coordinates('lat', 'lng')
+            radius = float(request.args.get('radius', 50))
+        except ValueError:
+            return jsonify({
+                'code': 400,
+                'msg': 'lat and lng must be valid coordinates and radius a number'
+            }), 400
+        if not 0 < radius <= GEO_MAX_RADIUS_KM:
+            return jsonify({
+                'code': 400,
+                'msg': f'radius must be greater than 0 and at most {GEO_MAX_RADIUS_KM:g} km'
+            }), 400
+        result, validators = bl.get_alerts_within_radius(lat, lng, radius)
+        if result['code'] != 200:
+            return jsonify(result), result['code']
+        return _cached_response(validators, result)
+    except Exception as e:
+        logger.error("Error in get_nearby_alerts: %s", e)
+        return jsonify({
+            'code': 500,
+            'msg': 'Internal server error'
+        }), 500
+
+@app.route('/alerts/bbox')
+@_limit(RATE_LIMIT_CACHED)
+def get_bbox_alerts():
+    try:
+        logger.debug("Bounding box alerts request received for: %s", dict(request.args))
+        try:
+            min_lat, min_lng, max_lat, max_lng = _coordinates('min_lat', 'min_lng', 'max_lat', 'max_lng')
+        except ValueError:
+            return jsonify({
+                'code': 400,
+                'msg': 'min_lat, min_lng, max_lat and max_lng must be valid coordinates'
+            }), 400
+        if min_lat > max_lat or min_lng > max_lng:
+            return jsonify({
+                'code': 400,
+                'msg': 'min_lat and min_lng must not exceed max_lat and max_lng'
+            }), 400
+        result, validators = bl.get_alerts_in_bbox(min_lat, min_lng, max_lat, max_lng)
+        if result['code'] != 200:
+            return jsonify(result), result['code']
+        return _cached_response(validators, result)
+    except Exception as e:
+        logger.error("Error in get_bbox_alerts: %s", e)
+        return jsonify({
+            'code': 500,
+            'msg': 'Internal server error'
+        }), 500
+
+@app.route('/alerts/stream')
+@_limit(DEFAULT_RATE_LIMIT)
+def stream_alerts():
+    try:
+        logger.debug("Alerts stream request received")
+        if ALERTS_STREAM_MAX_THREADED_CLIENTS == 0:
+            return jsonify({
+                'code': 503,
+                'msg': 'Alert streaming needs SERVER_THREADS of at least 2'
+            }), 503
+        subscriber, opening = bl.subscribe_alert_changes(ALERTS_STREAM_MAX_THREADED_CLIENTS)
+        if subscriber is None:
+            return jsonify({
+                'code': 503,
+                'msg': 'Too many alert stream clients, try again later'
+            }), 503
+
+        def generate():
+            try:
+                yield opening
+                while True:
+                    event = subscriber.get(stream.ALERTS_STREAM_HEARTBEAT)
+                    if subscriber.evicted:
+                        yield stream.sse_event({'reason': 'Client is not keeping up'}, event='evicted')
+                        return
+                    yield event or stream.HEARTBEAT
+            finally:
+                bl.unsubscribe_alert_changes(subscriber)
+
+        response = app.response_class(generate(), mimetype='text/event-stream')
+        response.cache_control.no_store = True
+        # Stop proxies such as nginx from buffering the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
     except Exception as e:
-        logger.error(f"Error in get_state_alerts: {str(e)}")
+        logger.error("Error in stream_alerts: %s", e)
         return jsonify({
             'code': 500,
             'msg': 'Internal server error'
         }), 500
 
 @app.route('/alerts/summary')
+@_limit(RATE_LIMIT_CACHED)
 def get_alerts_summary():
     try:
         logger.debug("Weather alerts summary request received")
-        result = bl.get_alerts_summary()
-        return jsonify(result), result['code']
+        body, code, validators = bl.get_alerts_summary_json()
+        if code != 200:
+            return _json_body(body, code)
+        return _cached_response(validators, body)
+    except Exception as e:
+        logger.error("Error in get_alerts_summary: %s", e)
+        return jsonify({
+            'code': 500,
+            'msg': 'Internal server error'
+        }), 500
+
+@app.route('/alerts/changes')
+@_limit(RATE_LIMIT_CACHED)
+def get_alert_changes():
+    try:
+        since = request.args.get('since')
+        logger.debug("Alert changes request received since version: %s", since)
+        result, validators = bl.get_alert_changes(since)
+        if result['code'] != 200:
+            return jsonify(result), result['code']
+        return _cached_response(validators, result)
+    except Exception as e:
+        logger.error("Error in get_alert_changes: %s", e)
+        return jsonify({
+            'code': 500,
+            'msg': 'Internal server error'
+        }), 500
+
+@app.route('/ready')
+@limiter.exempt
+def get_readiness():
+    try:
+        result = bl.get_readiness()
+        response = jsonify(result)
+        response.status_code = result['code']
+        response.cache_control.no_store = True
+        return response
+    except Exception as e:
+        logger.error("Error in get_readiness: %s", e)
+        return jsonify({
+            'code': 500,
+            'msg': 'Internal server error'
+        }), 500
+
+@app.route('/status/refresher')
+@_limit(RATE_LIMIT_CACHED)
+def get_refresher_status():
+    try:
+        result = bl.get_refresher_status()
+        response = jsonify(result)
+        response.cache_control.no_store = True
+        return response, result['code']
+    except Exception as e:
+        logger.error("Error in get_refresher_status: %s", e)
+        return jsonify({
+            'code': 500,
+            'msg': 'Internal server error'
+        }), 500
+
+@app.route('/status/upstream')
+@_limit(RATE_LIMIT_CACHED)
+def get_upstream_status():
+    try:
+        result = bl.get_upstream_status()
+        response = jsonify(result)
+        response.cache_control.no_store = True
+        return response, result['code']
     except Exception as e:
-        logger.error(f"Error in get_alerts_summary: {str(e)}")
+        logger.error("Error in get_upstream_status: %s", e)
         return jsonify({
             'code': 500,
             'msg': 'Internal server error'
         }), 500
 
+@app.route('/metrics')
+@limiter.exempt
+def get_metrics():
+    # Counters and histograms are per process; scrape each worker separately
+    response = app.response_class(metrics.render(), mimetype='text/plain')
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.cache_control.no_store = True
+    return response
+
 if __name__ == '__main__':
     logger.info("Starting weather API server...")
     try:
-        waitress.serve(app, host='0.0.0.0', port=1875)
+        if SERVER_MODE == 'asgi':
+            import uvicorn
+            uvicorn.run('asgi:app', host='0.0.0.0', port=1875)
+        else:
+            import waitress
+            waitress.serve(app, host='0.0.0.0', port=1875, threads=SERVER_THREADS)
     except Exception as e:
-        logger.error(f"Server failed to start: {str(e)}")
\ No newline at end of file
+        logger.error("Server failed to start: %s", e)
\ No newline at end of file
@@ -0,0 +1,204 @@
+# asgi.py
+# ASGI entry point (SERVER_MODE=asgi, or `uvicorn asgi:app`). The station,
+# weather and alerts routes are async: a request waiting on IMD awaits the
+# aiohttp fetch instead of holding a worker thread, and /alerts/stream
+# clients await their events on the event loop. Every other route is
+# served by the Flask app in app.py, mounted underneath.
+import asyncio
+import contextlib
+import logging
+
+from a2wsgi import WSGIMiddleware
+from limits import parse_many
+from limits.strategies import SlidingWindowCounterRateLimiter
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as wsgi
+import bl
+import metrics
+import serializer
+import stream
+
+logger = logging.getLogger(__name__)
+
+# Same strategy and storage as the Flask limiter
+_rate_limiter = SlidingWindowCounterRateLimiter(wsgi.limiter.storage)
+
+
+def _json(result, code=None):
+    return Response(serializer.dumps(result), status_code=code or result['code'], media_type='application/json')
+
+
+def _route_path(request):
+    """Path template of the matched route, so metrics are not labelled per station or state"""
+    route = request.scope.get('route')
+    return route.path if route is not None else request.url.path
+
+
+def _cached_response(request, validators, payload):
+    route = _route_path(request)
+    with metrics.encode_seconds.time(route):
+        status, body, headers = serializer.respond(validators, payload, request.headers, route)
+    return Response(body, status_code=status, headers=headers, media_type='application/json' if body else None)
+
+
+def _route(default_limits, endpoint_name=None):
+    """
+    Apply the per-client rate limits (overridable per route as in app.py,
+    by the Flask endpoint name) and turn unexpected errors into 500s, as
+    the Flask routes do.
+    """
+    def decorator(handler):
+        limits = parse_many(wsgi.route_limits(endpoint_name or handler.__name__, default_limits))
+
+        def hit(client):
+            return all(_rate_limiter.hit(limit, handler.__name__, client) for limit in limits)
+
+        async def endpoint(request):
+            client = request.client.host if request.client else ''
+            # The limiter's storage (SQLite by default) blocks, so keep it off the event loop
+            if not await run_in_threadpool(hit, client):
+                metrics.rate_limited.inc(_route_path(request))
+                return _json({
+                    'code': 429,
+                    'msg': 'Rate limit exceeded'
+                })
+            try:
+                return await handler(request)
+            except Exception as e:
+                logger.error("Error in %s: %s", handler.__name__, e)
+                return _json({
+                    'code': 500,
+                    'msg': 'Internal server error'
+                })
+        return endpoint
+    return decorator
+
+
+@_route(wsgi.RATE_LIMIT_CACHED, 'get_station')
+async def get_all_stations(request):
+    body, code = bl.get_all_stations_json()
+    if code != 200:
+        return Response(body, status_code=code, media_type='application/json')
+    return _cached_response(request, bl.get_stations_validators(), body)
+
+
+@_route(wsgi.RATE_LIMIT_CACHED)
+async def get_station(request):
+    id = request.path_params['id']
+    result = bl.get_station_by_id(id)
+    if result['code'] != 200:
+        return _json(result)
+    return _cached_response(request, bl.get_stations_validators(id), result)
+
+
+@_route(wsgi.DEFAULT_RATE_LIMIT)
+async def get_station_weather(request):
+    id = request.path_params['id']
+    logger.debug("Weather request received for station ID: %s", id)
+    result, validators = await bl.get_station_weather_async(id, request.app.state.session)
+    if result['code'] != 200:
+        return _json(result)
+    return _cached_response(request, validators, result)
+
+
+@_route(wsgi.RATE_LIMIT_CACHED)
+async def get_all_alerts(request):
+    await bl.get_alerts_snapshot_async(request.app.state.session)
+    body, code, validators = bl.get_weather_alerts_json()
+    if code != 200:
+        return Response(body, status_code=code, media_type='application/json')
+    return _cached_response(request, validators, body)
+
+
+@_route(wsgi.RATE_LIMIT_CACHED)
+async def get_state_alerts(request):
+    state = request.path_params['state']
+    await bl.get_alerts_snapshot_async(request.app.state.session)
+    body, code, validators = bl.get_state_alerts_json(state)
+    if code != 200:
+        return Response(body, status_code=code, media_type='application/json')
+    return _cached_response(request, validators, body)
+
+
+@_route(wsgi.RATE_LIMIT_CACHED)
+async def get_alerts_summary(request):
+    await bl.get_alerts_snapshot_async(request.app.state.session)
+    body, code, validators = bl.get_alerts_summary_json()
+    if code != 200:
+        return Response(body, status_code=code, media_type='application/json')
+    return _cached_response(request, validators, body)
+
+
+@_route(wsgi.RATE_LIMIT_CACHED)
+async def get_alert_changes(request):
+    since = request.query_params.get('since')
+    await bl.get_alerts_snapshot_async(request.app.state.session)
+    result, validators = bl.get_alert_changes(since)
+    if result['code'] != 200:
+        return _json(result)
+    return _cached_response(request, validators, result)
+
+
+@_route(wsgi.DEFAULT_RATE_LIMIT)
+async def stream_alerts(request):
+    # Open streams await their events here rather than each holding one of
+    # the WSGI server's threads, so only ALERTS_STREAM_MAX_CLIENTS applies
+    await bl.get_alerts_snapshot_async(request.app.state.session)
+    subscriber, opening = bl.subscribe_alert_changes(loop=asyncio.get_running_loop())
+    if subscriber is None:
+        return _json({
+            'code': 503,
+            'msg': 'Too many alert stream clients, try again later'
+        })
+
+    async def generate():
+        try:
+            yield opening
+            while True:
+                event = await subscriber.aget(stream.ALERTS_STREAM_HEARTBEAT)
+                if subscriber.evicted:
+                    yield stream.sse_event({'reason': 'Client is not keeping up'}, event='evicted')
+                    return
+                yield event or stream.HEARTBEAT
+        finally:
+            bl.unsubscribe_alert_changes(subscriber)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-store',
+        # Stop proxies such as nginx from buffering the stream
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # One keep-alive pool to IMD for all async handlers in this process; in
+    # worker mode nothing is fetched, so no session is opened
+    if bl.SCRAPE_MODE == 'worker':
+        app.state.session = None
+        yield
+        return
+    import async_scraper
+    async with async_scraper.new_session() as session:
+        app.state.session = session
+        yield
+
+
+app = Starlette(
+    routes=[
+        Route('/station/all', get_all_stations),
+        Route('/station/{id:int}', get_station),
+        Route('/weather/{id:int}', get_station_weather),
+        Route('/alerts', get_all_alerts),
+        Route('/alerts/state/{state}', get_state_alerts),
+        Route('/alerts/stream', stream_alerts),
+        Route('/alerts/summary', get_alerts_summary),
+        Route('/alerts/changes', get_alert_changes),
+        Mount('/', WSGIMiddleware(wsgi.app)),
+    ],
+    lifespan=lifespan
+)
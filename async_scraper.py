@@ -0,0 +1,126 @@
+# async_scraper.py
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+import scraper
+import upstream
+
+logger = logging.getLogger(__name__)
+
+# Maximum station pages fetched from IMD at the same time
+ASYNC_FETCH_CONCURRENCY = int(os.getenv('ASYNC_FETCH_CONCURRENCY', 10))
+# Threads that parse fetched pages off the event loop
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', 4))
+
+_parse_pool = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix='parse')
+
+
+def _timeout():
+    return aiohttp.ClientTimeout(
+        total=upstream.UPSTREAM_DEADLINE,
+        sock_connect=upstream.UPSTREAM_CONNECT_TIMEOUT,
+        sock_read=upstream.UPSTREAM_READ_TIMEOUT
+    )
+
+
+def new_session(concurrency=ASYNC_FETCH_CONCURRENCY):
+    connector = aiohttp.TCPConnector(limit=concurrency, ssl=False)
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=upstream.HEADERS,
+        timeout=_timeout()
+    )
+
+
+async def _parse(parse, html_text):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_parse_pool, parse, html_text)
+
+
+async def _fetch_page(session, URL, parse, what, page):
+    """GET and parse one IMD page, conditionally if it was fetched before; failures become error dicts"""
+    try:
+        etag, last_modified, parsed = scraper.remembered_page(URL)
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        async with upstream.aguarded(page) as call:
+            async with session.get(URL, headers=headers) as response:
+                logger.debug("GET %s -> %s", URL, response.status)
+                call.status = response.status
+                if response.status == 304 and parsed is not None:
+                    call.ok = True
+                    return parsed
+                if response.status != 200:
+                    call.ok = response.status < 500
+                    return {
+                        'error': f'Server returned status code {response.status}',
+                        'code': response.status
+                    }
+                # Only a fully read body counts as a success; a timeout or
+                # disconnect while reading it is a failure for the breaker
+                html_text = await response.text()
+                call.ok = True
+                etag, last_modified = upstream.validators(response)
+
+        data = await _parse(parse, html_text)
+        if 'error' not in data:
+            scraper.remember_page(URL, etag, last_modified, data)
+        return data
+
+    except upstream.UpstreamUnavailable as e:
+        logger.warning("Not fetching %s: %s", what, e)
+        return {
+            'error': str(e),
+            'code': 503
+        }
+    except asyncio.TimeoutError:
+        logger.error("Request timed out for %s", what)
+        return {
+            'error': 'Request timed out',
+            'code': 504
+        }
+    except aiohttp.ClientError as e:
+        logger.error("Request error for %s: %s", what, e)
+        return {
+            'error': f'Network error: {str(e)}',
+            'code': 500
+        }
+    except Exception as e:
+        logger.error("Unexpected error for %s: %s", what, e)
+        return {
+            'error': f'Unexpected error: {str(e)}',
+            'code': 500
+        }
+
+
+async def fetch_station(session, id):
+    """Async equivalent of scraper.get_station_data using an open aiohttp session"""
+    return await _fetch_page(session, scraper.station_url(id), scraper.parse_station_data, f'station {id}', 'station')
+
+
+async def fetch_alerts(session):
+    """Async equivalent of scraper.get_alerts using an open aiohttp session"""
+    return await _fetch_page(session, scraper.alerts_url(), scraper.parse_alerts_page, 'alerts', 'alerts')
+
+
+async def fetch_stations(ids, concurrency=ASYNC_FETCH_CONCURRENCY):
+    """Fetch many stations in parallel; returns {id: weather data or error dict}"""
+    async with new_session(concurrency) as session:
+        results = await asyncio.gather(*(fetch_station(session, id) for id in ids))
+    return dict(zip(ids, results))
+
+
+def get_stations_data(ids, concurrency=ASYNC_FETCH_CONCURRENCY):
+    """Blocking entry point for callers without an event loop"""
+    ids = list(ids)
+    if not ids:
+        return {}
+    return asyncio.run(fetch_stations(ids, concurrency))
@@ -0,0 +1,200 @@
+"""
+End-to-end load scenarios against the API served from this checkout, with
+IMD replaced by the local stub server (benchmarks/stub_server.py). Each
+scenario starts a fresh server process with its own snapshot database,
+drives it with closed-loop clients for a fixed time and reports latency
+percentiles, throughput, status codes and how many requests reached the
+stub.
+
+    python benchmarks/bench_load.py [--server wsgi|asgi] [--duration 10] [--concurrency 16]
+                                    [--scenario NAME ...] [--json] [--output results.json]
+
+The load generator runs in this process, so on small machines it shares
+CPU with the server; compare results measured on the same machine.
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from harness import REPO_DIR, report, summarize
+from stub_server import StubServer
+
+# Stations the weather scenarios spread requests over
+STATION_IDS = [42027, 42062, 42105, 42178, 42260, 42308, 42410, 42527, 42667, 42727, 42874, 43049]
+
+# name: (request paths, server environment, stub settings)
+SCENARIOS = {
+    'station_list': (['/station/all'], {}, {}),
+    'station_detail': ([f'/station/{id}' for id in STATION_IDS], {}, {}),
+    'weather_cached': ([f'/weather/{id}' for id in STATION_IDS], {}, {'latency': 0.05}),
+    'weather_uncached': (
+        [f'/weather/{id}' for id in STATION_IDS],
+        {'WEATHER_CACHE_TTL': '0', 'WEATHER_CACHE_STALE_TTL': '0', 'WEATHER_CACHE_ERROR_TTL': '0'},
+        {'latency': 0.05}
+    ),
+    'weather_batch': (['/weather?ids=' + ','.join(map(str, STATION_IDS))], {}, {'latency': 0.05}),
+    'alerts': (['/alerts'], {}, {'latency': 0.2}),
+    'alerts_state': (['/alerts/state/Kerala', '/alerts/state/Assam', '/alerts/summary'], {}, {'latency': 0.2}),
+    'upstream_slow': (
+        [f'/weather/{id}' for id in STATION_IDS],
+        {'WEATHER_CACHE_TTL': '0', 'WEATHER_CACHE_STALE_TTL': '0', 'WEATHER_CACHE_ERROR_TTL': '0'},
+        {'latency': 0.5, 'jitter': 1.0}
+    ),
+    'upstream_errors': (
+        [f'/weather/{id}' for id in STATION_IDS],
+        {
+            'WEATHER_CACHE_TTL': '0', 'WEATHER_CACHE_STALE_TTL': '0', 'WEATHER_CACHE_ERROR_TTL': '0',
+            'UPSTREAM_RETRIES': '0', 'UPSTREAM_READ_TIMEOUT': '1'
+        },
+        {'latency': 0.05, 'error_rate': 0.2, 'timeout_rate': 0.05, 'hang': 2.0}
+    ),
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _server_command(mode, port, threads):
+    if mode == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                '--log-level', 'warning']
+    return [sys.executable, '-c',
+            f'import waitress, app; waitress.serve(app.app, host="127.0.0.1", port={port}, threads={threads})']
+
+
+def start_server(mode, env, threads, data_dir):
+    """Start the API in a subprocess and wait until it answers; returns (process, base url)"""
+    port = _free_port()
+    process = subprocess.Popen(
+        _server_command(mode, port, threads),
+        cwd=REPO_DIR,
+        env={
+            **os.environ,
+            'SNAPSHOT_DB': os.path.join(data_dir, 'snapshots.db'),
+            'HISTORY_DIR': os.path.join(data_dir, 'history'),
+            'RATE_LIMIT_DAILY': '100000000',
+            'RATE_LIMIT_HOURLY': '100000000',
+            **env
+        },
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        try:
+            requests.get(f'{url}/station/all', timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('server did not start within 30 seconds')
+
+
+def run_load(url, paths, duration, concurrency, seed=0):
+    """Closed-loop load: `concurrency` clients each send the next request as soon as the last completes"""
+    deadline = time.monotonic() + duration
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def client(index):
+        rng = random.Random(seed + index)
+        session = requests.Session()
+        local_latencies = []
+        local_statuses = {}
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status = str(session.get(url + rng.choice(paths), timeout=30).status_code)
+            except requests.RequestException:
+                status = 'error'
+            local_latencies.append(time.perf_counter() - start)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    started = time.monotonic()
+    clients = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return latencies, statuses, time.monotonic() - started
+
+
+def run_scenario(name, args):
+    paths, env, stub_settings = SCENARIOS[name]
+    with StubServer(hang=stub_settings.get('hang', 60.0), seed=0) as stub, \
+            tempfile.TemporaryDirectory(prefix='imd-bench-') as data_dir:
+        process, url = start_server(args.server, {'IMD_BASE_URL': stub.url, **env}, args.threads, data_dir)
+        try:
+            # Warm up with a healthy upstream so cached scenarios start cached
+            for path in paths:
+                requests.get(url + path, timeout=30)
+            for attribute, value in stub_settings.items():
+                setattr(stub, attribute, value)
+            upstream_before = stub.requests
+            latencies, statuses, elapsed = run_load(url, paths, args.duration, args.concurrency)
+            upstream_requests = stub.requests - upstream_before
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+    failed = sum(count for status, count in statuses.items() if status == 'error' or int(status) >= 500)
+    return {
+        'name': name,
+        'server': args.server,
+        'concurrency': args.concurrency,
+        'duration_s': round(elapsed, 2),
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'failed': failed,
+        'statuses': dict(sorted(statuses.items())),
+        'upstream_requests': upstream_requests,
+        'latency_ms': summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi', help='serving mode, as SERVER_MODE')
+    parser.add_argument('--threads', type=int, default=16, help='waitress worker threads (wsgi mode)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per scenario')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable); all by default')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenario or SCENARIOS:
+        result = run_scenario(name, args)
+        results.append(result)
+        if not args.json:
+            latency = result['latency_ms']
+            print(f"{name:<18} {result['throughput_rps']:>8.1f} req/s  p50 {latency.get('p50', 0):>8.2f}  "
+                  f"p95 {latency.get('p95', 0):>8.2f}  p99 {latency.get('p99', 0):>8.2f} ms  "
+                  f"failed {result['failed']:>5}  upstream {result['upstream_requests']:>5}", flush=True)
+
+    report('load', results, args.json, args.output)
+
+
+if __name__ == '__main__':
+    main()
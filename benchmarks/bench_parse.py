@@ -0,0 +1,75 @@
+"""
+Microbenchmarks for reading IMD pages: parse_station_data and
+parse_alerts_page on the recorded fixtures, and get_station_data and
+get_alerts end to end (HTTP fetch from the local stub plus parse). The
+stub has no added latency, so the fetch cost is the client's own work.
+
+    python benchmarks/bench_parse.py [--iterations N] [--json] [--output results.json]
+
+Log output below WARNING is disabled while measuring.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from harness import report, summarize  # noqa: E402
+from stub_server import StubServer, load_fixture  # noqa: E402
+
+
+def _measure(fn, iterations, setup=None):
+    samples = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200, help='calls per benchmark')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    with StubServer().start() as stub:
+        # upstream reads IMD_BASE_URL at import time
+        os.environ['IMD_BASE_URL'] = stub.url
+        os.environ.setdefault('UPSTREAM_RETRIES', '0')
+        import scraper
+        logging.disable(logging.INFO)
+
+        station_html = load_fixture('station.html').decode('utf-8')
+        nowcast_html = load_fixture('nowcast.html').decode('utf-8')
+        # Forget the last ETag so every call downloads and parses the full page
+        forget = scraper._last_pages.clear
+
+        benchmarks = [
+            ('parse_station_data', lambda: scraper.parse_station_data(station_html), None),
+            ('parse_alerts_page', lambda: scraper.parse_alerts_page(nowcast_html), None),
+            ('get_station_data', lambda: scraper.get_station_data(43003), forget),
+            ('get_alerts', scraper.get_alerts, forget),
+        ]
+        assert 'error' not in scraper.get_station_data(43003), 'stub server not reachable'
+
+        results = []
+        for name, fn, setup in benchmarks:
+            fn()
+            results.append({'name': name, 'unit': 'ms', **_measure(fn, args.iterations, setup)})
+
+    report('parse', results, args.json, args.output)
+    if args.json:
+        return
+    print(f"{'benchmark':<20} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}  (ms, {args.iterations} calls)")
+    for result in results:
+        print(f"{result['name']:<20} {result['mean']:>9.3f} {result['p50']:>9.3f} {result['p95']:>9.3f} {result['p99']:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
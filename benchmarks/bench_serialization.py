@@ -0,0 +1,114 @@
+"""
+Bytes on the wire and encode time for the /station/all and /alerts bodies,
+before (json.dumps on every request, uncompressed) and after (serializer
+module: fast encoder, bodies and compressed variants cached per version).
+
+    python benchmarks/bench_serialization.py [--alerts N] [--requests N] [--json] [--output results.json]
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import serializer  # noqa: E402
+from harness import report  # noqa: E402
+
+
+def _stations_payload():
+    with open(os.path.join(os.path.dirname(serializer.__file__), 'stations.json'), 'r', encoding='utf-8') as file:
+        return {'code': 200, 'result': json.load(file)}
+
+
+def _alerts_payload(count):
+    # Same shape as scraper.get_alerts() results
+    rng = random.Random(0)
+    levels = ('No Warning', 'Watch', 'Alert', 'Warning')
+    states = ('Kerala', 'Tamil Nadu', 'Maharashtra', 'Gujarat', 'Odisha', 'Assam', 'Punjab', 'Bihar')
+    alerts = [
+        {
+            'location': f'District {i}',
+            'state': rng.choice(states),
+            'coordinates': {'lat': round(rng.uniform(8, 35), 4), 'lng': round(rng.uniform(68, 97), 4)},
+            'alert_level': rng.choice(levels),
+            'color': rng.choice(('#00ff00', '#ffff00', '#ffa500', '#ff0000')),
+            'message': 'Thunderstorm with lightning and gusty winds likely',
+            'warning_type': 'Thunderstorm',
+        }
+        for i in range(count)
+    ]
+    return {'code': 200, 'result': {'alerts': alerts, 'last_updated': '17-10-2026 13:45 IST'}}
+
+
+def _baseline(payload):
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def _per_request_us(fn, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def bench(name, payload, requests):
+    raw = _baseline(payload)
+    cache = serializer.EncodedCache()
+    # Compressed variant built on first request, served from the cache after
+    first_start = time.perf_counter()
+    cache.get('v1', payload, 'gzip')
+    first_us = (time.perf_counter() - first_start) * 1e6
+
+    result = {
+        'name': name,
+        'serializer': serializer.JSON_SERIALIZER,
+        'before': {
+            'bytes': len(raw),
+            'encode_us': round(_per_request_us(lambda: _baseline(payload), requests), 1),
+        },
+        'after': {
+            'encode_cold_us': round(_per_request_us(lambda: serializer.dumps(payload), requests), 1),
+            'first_request_us': round(first_us, 1),
+            'cached_us': round(_per_request_us(lambda: cache.get('v1', payload, 'gzip'), requests), 2),
+        },
+    }
+    for encoding, compress in serializer.COMPRESSORS.items():
+        compressed = compress(raw)
+        result['after'][f'{encoding}_bytes'] = len(compressed)
+        result['after'][f'{encoding}_compress_us'] = round(_per_request_us(lambda: compress(raw), max(1, requests // 10)), 1)
+    assert gzip.decompress(cache.get('v1', payload, 'gzip')[0]) == serializer.dumps(payload)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', type=int, default=700, help='markers in the synthetic alerts document')
+    parser.add_argument('--requests', type=int, default=200, help='iterations per measurement')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    results = [
+        bench('/station/all', _stations_payload(), args.requests),
+        bench('/alerts', _alerts_payload(args.alerts), args.requests),
+    ]
+    report('serialization', results, args.json, args.output)
+    if args.json:
+        return
+
+    for result in results:
+        before, after = result['before'], result['after']
+        print(f"{result['name']} (serializer: {result['serializer']})")
+        print(f"  before: {before['bytes']:>9} bytes  {before['encode_us']:>10.1f} us/request (json.dumps, identity)")
+        print(f"  after:  {after['gzip_bytes']:>9} bytes  {after['cached_us']:>10.2f} us/request (cached gzip)")
+        print(f"          first request {after['first_request_us']:.1f} us, uncached encode {after['encode_cold_us']:.1f} us")
+        if 'br_bytes' in after:
+            print(f"          brotli {after['br_bytes']} bytes, {after['br_compress_us']:.1f} us to compress")
+
+
+if __name__ == '__main__':
+    main()
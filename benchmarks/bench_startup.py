@@ -0,0 +1,208 @@
+"""
+Startup benchmarks: how long until a fresh process can serve.
+
+- import: seconds spent in `import app`, and in importing the scraping
+  stack (scraper, async_scraper, upstream) that the app now defers.
+- ready: time from starting a server until /ready first answers 200,
+  under waitress and under gunicorn with gunicorn.conf.py (preload), with
+  an empty snapshot store (cold: the alerts are fetched from the stub) and
+  with one published by the scrape worker (warm).
+- respawn: time from killing a gunicorn worker until its replacement is
+  ready, with and without preload_app. This is the cost paid on every
+  deploy restart and scale-out.
+
+    python benchmarks/bench_startup.py [--iterations 5] [--json] [--output results.json]
+
+gunicorn cases are skipped if gunicorn is not installed.
+"""
+import argparse
+import importlib.util
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from harness import REPO_DIR, report, summarize
+from stub_server import StubServer
+
+# Stations the scrape worker publishes for the warm cases
+STATION_IDS = [42027, 42062, 42105, 42178, 42260, 42308, 42410, 42527, 42667, 42727, 42874, 43049]
+
+_IMPORT = '''
+import time
+start = time.perf_counter()
+import app
+middle = time.perf_counter()
+import scraper, async_scraper, upstream
+print(middle - start, time.perf_counter() - middle)
+'''
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _env(stub_url, data_dir, **extra):
+    return {
+        **os.environ,
+        'IMD_BASE_URL': stub_url,
+        'SNAPSHOT_DB': os.path.join(data_dir, 'snapshots.db'),
+        'HISTORY_DIR': os.path.join(data_dir, 'history'),
+        'RATE_LIMIT_STORAGE': 'memory://',
+        'LOG_LEVEL': 'WARNING',
+        **extra
+    }
+
+
+def _server_command(server, port):
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+                '--workers', '1', 'app:app']
+    return [sys.executable, '-c', f'import waitress, app; waitress.serve(app.app, host="127.0.0.1", port={port})']
+
+
+def _wait_ready(url, started, exclude_pid=None, timeout=60):
+    """
+    (seconds from `started` until /ready first answered, until it answered
+    200 from a process other than `exclude_pid`, that ready result)
+    """
+    session = requests.Session()
+    answered = None
+    while time.perf_counter() - started < timeout:
+        try:
+            response = session.get(f'{url}/ready', timeout=10)
+            answered = answered or time.perf_counter() - started
+            if response.status_code == 200:
+                result = response.json()['result']
+                if result['pid'] != exclude_pid:
+                    return answered, time.perf_counter() - started, result
+        except requests.RequestException:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f'{url} not ready within {timeout} seconds')
+
+
+def _publish(stub_url, data_dir):
+    """Fill a snapshot store with the scrape worker; returns its path"""
+    subprocess.run(
+        [sys.executable, 'worker.py', '--once', '--processes', '2', '--stations', ','.join(map(str, STATION_IDS))],
+        cwd=REPO_DIR, env=_env(stub_url, data_dir), check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return os.path.join(data_dir, 'snapshots.db')
+
+
+def _start(server, stub_url, data_dir, published, **env):
+    if published:
+        shutil.copy(published, os.path.join(data_dir, 'snapshots.db'))
+    port = _free_port()
+    process = subprocess.Popen(
+        _server_command(server, port), cwd=REPO_DIR, env=_env(stub_url, data_dir, **env),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return process, f'http://127.0.0.1:{port}'
+
+
+def _stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def bench_import(stub_url, iterations):
+    app_samples, deferred_samples = [], []
+    with tempfile.TemporaryDirectory(prefix='imd-bench-') as data_dir:
+        for _ in range(iterations):
+            output = subprocess.run(
+                [sys.executable, '-W', 'ignore', '-c', _IMPORT], cwd=REPO_DIR, env=_env(stub_url, data_dir),
+                capture_output=True, text=True, check=True
+            ).stdout.split()
+            app_samples.append(float(output[0]))
+            deferred_samples.append(float(output[1]))
+    return [
+        {'name': 'import_app', 'unit': 'ms', **summarize(app_samples)},
+        {'name': 'import_deferred', 'unit': 'ms', **summarize(deferred_samples)},
+    ]
+
+
+def bench_ready(server, warm, stub_url, published, iterations):
+    answered, ready = [], []
+    for _ in range(iterations):
+        with tempfile.TemporaryDirectory(prefix='imd-bench-') as data_dir:
+            started = time.perf_counter()
+            process, url = _start(server, stub_url, data_dir, published if warm else None)
+            try:
+                first, done, _ = _wait_ready(url, started)
+                answered.append(first)
+                ready.append(done)
+            finally:
+                _stop(process)
+    return {
+        'name': f"ready_{server}_{'warm' if warm else 'cold'}",
+        'unit': 'ms',
+        'first_response_ms': summarize(answered),
+        'ready_ms': summarize(ready),
+    }
+
+
+def bench_respawn(preload, stub_url, published, iterations):
+    samples = []
+    with tempfile.TemporaryDirectory(prefix='imd-bench-') as data_dir:
+        process, url = _start('gunicorn', stub_url, data_dir, published, GUNICORN_PRELOAD='1' if preload else '0')
+        try:
+            pid = _wait_ready(url, time.perf_counter())[2]['pid']
+            for _ in range(iterations):
+                started = time.perf_counter()
+                os.kill(pid, signal.SIGKILL)
+                _, done, result = _wait_ready(url, started, exclude_pid=pid)
+                samples.append(done)
+                pid = result['pid']
+        finally:
+            _stop(process)
+    return {'name': f"respawn_{'preload' if preload else 'no_preload'}", 'unit': 'ms', **summarize(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5, help='runs per benchmark')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    servers = ['waitress']
+    if importlib.util.find_spec('gunicorn') is not None:
+        servers.append('gunicorn')
+    elif not args.json:
+        print('gunicorn not installed, skipping gunicorn cases')
+
+    with StubServer().start() as stub, tempfile.TemporaryDirectory(prefix='imd-bench-') as publish_dir:
+        published = _publish(stub.url, publish_dir)
+        results = bench_import(stub.url, args.iterations)
+        for server in servers:
+            for warm in (False, True):
+                results.append(bench_ready(server, warm, stub.url, published, args.iterations))
+        if 'gunicorn' in servers:
+            for preload in (True, False):
+                results.append(bench_respawn(preload, stub.url, published, args.iterations))
+
+    report('startup', results, args.json, args.output)
+    if args.json:
+        return
+    print(f"{'benchmark':<24} {'mean':>9} {'p50':>9} {'max':>9}  (ms, {args.iterations} runs)")
+    for result in results:
+        summary = result.get('ready_ms', result)
+        print(f"{result['name']:<24} {summary['mean']:>9.1f} {summary['p50']:>9.1f} {summary['max']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
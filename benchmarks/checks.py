@@ -0,0 +1,193 @@
+"""
+Offline correctness checks for code paths the benchmarks measure, run
+against the recorded fixtures and the local IMD stub:
+
+    python benchmarks/checks.py [--check NAME ...]
+
+Each check prints what it compared; the script exits with status 1 if
+any check fails.
+"""
+import argparse
+import logging
+import os
+import re
+import socket
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bs4 import BeautifulSoup  # noqa: E402
+from stub_server import StubServer, load_fixture  # noqa: E402
+
+
+def _reference_parse_station_data(html_text):
+    """
+    parse_station_data as it was before the single-pass parser: the full
+    document tree and one soup.find per label and forecast day.
+    """
+    soup = BeautifulSoup(html_text, 'html.parser')
+    if not soup.find('table', {'class': 'table'}):
+        return {'error': 'Weather data table not found', 'code': 500}
+
+    def find_value_by_label(label_text):
+        try:
+            label_cell = soup.find(string=re.compile(label_text, re.IGNORECASE))
+            if label_cell:
+                next_cell = label_cell.find_parent('td').find_next_sibling('td')
+                if next_cell:
+                    return next_cell.text.strip()
+        except AttributeError:
+            pass
+        return "0"
+
+    def safe_float(value, default=0.0):
+        try:
+            return float(re.sub(r'[^0-9.-]', '', value))
+        except (ValueError, TypeError):
+            return default
+
+    forecast = []
+    for day_number in range(1, 8):
+        date_cell = soup.find(string=re.compile(f"Day {day_number}"))
+        date_row = date_cell.find_parent('tr') if date_cell else None
+        cells = date_row.find_all('td') if date_row else []
+        if len(cells) >= 4:
+            forecast.append({
+                'day': day_number,
+                'date': cells[0].text.strip(),
+                'min': safe_float(cells[1].text.strip()),
+                'max': safe_float(cells[2].text.strip()),
+                'condition': cells[3].text.strip()
+            })
+
+    return {
+        'temperature': {
+            'max': {
+                'value': safe_float(find_value_by_label('Maximum Temperature')),
+                'departure': safe_float(find_value_by_label('Departure from Normal Max'))
+            },
+            'min': {
+                'value': safe_float(find_value_by_label('Minimum Temperature')),
+                'departure': safe_float(find_value_by_label('Departure from Normal Min'))
+            }
+        },
+        'humidity': {
+            'morning': safe_float(find_value_by_label('Relative Humidity.*0830')),
+            'evening': safe_float(find_value_by_label('Relative Humidity.*1730'))
+        },
+        'astronomical': {
+            'sunrise': find_value_by_label('Sunrise'),
+            'sunset': find_value_by_label('Sunset'),
+            'moonrise': find_value_by_label('Moonrise'),
+            'moonset': find_value_by_label('Moonset')
+        },
+        'forecast': forecast
+    }
+
+
+# A station page with label and forecast text outside the data table
+_TEXT_OUTSIDE_TABLE = '''<html><body>
+<p>Sunrise and sunset times are in IST. Day 1 is today.</p>
+<table class="table">
+<tr><td>Maximum Temperature</td><td>33.4</td></tr>
+<tr><td>Sunrise</td><td>06:29</td></tr>
+<tr><td>17-Oct</td><td>25.0</td><td>33.0</td><td>Partly cloudy sky</td><td>Day 1</td></tr>
+</table>
+</body></html>'''
+
+
+def check_station_parse_parity():
+    """parse_station_data matches the pre-single-pass parser on the fixture, with every parser setting"""
+    import scraper
+    failures = []
+    page = load_fixture('station.html').decode('utf-8')
+    expected = _reference_parse_station_data(page)
+    parsers = ['html.parser'] + (['lxml'] if scraper._DEFAULT_PARSER == 'lxml' else [])
+    saved = scraper.HTML_PARSER, scraper.STATION_PARSE_TABLES_ONLY
+    try:
+        for parser in parsers:
+            for tables_only in (True, False):
+                scraper.HTML_PARSER, scraper.STATION_PARSE_TABLES_ONLY = parser, tables_only
+                if scraper.parse_station_data(page) != expected:
+                    failures.append(f'station.html differs with {parser}, tables only {tables_only}')
+
+        # Pinned difference: only the full tree sees text outside the table,
+        # so the full-tree pass matches the old parser and tables-only reads
+        # the labels from inside the table
+        reference = _reference_parse_station_data(_TEXT_OUTSIDE_TABLE)
+        scraper.HTML_PARSER, scraper.STATION_PARSE_TABLES_ONLY = 'html.parser', False
+        if scraper.parse_station_data(_TEXT_OUTSIDE_TABLE) != reference:
+            failures.append('full-tree parse differs from the old parser with text outside the table')
+        scraper.STATION_PARSE_TABLES_ONLY = True
+        tables_only = scraper.parse_station_data(_TEXT_OUTSIDE_TABLE)
+        if tables_only['astronomical']['sunrise'] != '06:29' or len(tables_only['forecast']) != 1:
+            failures.append(f'tables-only parse did not read the table: {tables_only}')
+    finally:
+        scraper.HTML_PARSER, scraper.STATION_PARSE_TABLES_ONLY = saved
+    return failures
+
+
+def _refused_url():
+    """A local URL nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+
+def check_metrics_after_upstream_failure():
+    """/metrics still renders once IMD has answered with a status code and also failed outright"""
+    data_dir = tempfile.mkdtemp(prefix='imd-checks-')
+    os.environ.setdefault('SNAPSHOT_DB', os.path.join(data_dir, 'snapshots.db'))
+    os.environ.setdefault('HISTORY_DIR', os.path.join(data_dir, 'history'))
+    os.environ.setdefault('RATE_LIMIT_STORAGE', 'memory://')
+    import app
+    import upstream
+    failures = []
+    client = app.app.test_client()
+    saved = upstream.IMD_BASE_URL
+    try:
+        with StubServer().start() as stub:
+            upstream.IMD_BASE_URL = stub.url
+            client.get('/weather/42027')
+        # Labels the same series with 'error' next to the stub's 200
+        upstream.IMD_BASE_URL = _refused_url()
+        client.get('/weather/42062')
+    finally:
+        upstream.IMD_BASE_URL = saved
+    response = client.get('/metrics')
+    if response.status_code != 200:
+        failures.append(f'/metrics returned {response.status_code}')
+    else:
+        text = response.get_data(as_text=True)
+        for code in ('200', 'error'):
+            if f'code="{code}"' not in text:
+                failures.append(f'no upstream response sample with code {code}')
+    return failures
+
+
+CHECKS = {
+    'station_parse_parity': check_station_parse_parity,
+    'metrics_after_upstream_failure': check_metrics_after_upstream_failure,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--check', action='append', choices=sorted(CHECKS),
+                        help='check to run (repeatable); all by default')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    failed = 0
+    for name in args.check or CHECKS:
+        failures = CHECKS[name]()
+        print(f"{name:<32} {'FAIL' if failures else 'ok'}")
+        for failure in failures:
+            print(f'  {failure}')
+        failed += bool(failures)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
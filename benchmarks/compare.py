@@ -0,0 +1,76 @@
+"""
+Compare two benchmark result files written with --output, e.g. from the
+commit before and after a change:
+
+    python benchmarks/compare.py before.json after.json [--threshold 10]
+
+Numeric results are matched by benchmark name. Throughput is better when
+higher; times, sizes and failure counts are better when lower. Exits with
+status 1 if any metric got worse by more than the threshold (percent).
+"""
+import argparse
+import json
+import sys
+
+# Bookkeeping fields that describe a run rather than measure it, and
+# single-sample extremes too noisy to compare
+IGNORED = {'count', 'requests', 'duration_s', 'concurrency', 'upstream_requests', 'statuses', 'min', 'max'}
+
+
+def _flatten(result, prefix=''):
+    for key, value in result.items():
+        if key in IGNORED:
+            continue
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f'{prefix}{key}', value
+
+
+def _higher_is_better(metric):
+    return 'rps' in metric or 'throughput' in metric
+
+
+def _load(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        document = json.load(file)
+    return document, {result['name']: dict(_flatten(result)) for result in document['results']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10, help='percent change counted as a regression')
+    args = parser.parse_args()
+
+    before_doc, before = _load(args.before)
+    after_doc, after = _load(args.after)
+    print(f"{before_doc['suite']}: {before_doc['environment'].get('commit')} -> {after_doc['environment'].get('commit')}")
+
+    regressions = 0
+    for name, metrics in after.items():
+        if name not in before:
+            continue
+        print(name)
+        for metric, value in metrics.items():
+            old = before[name].get(metric)
+            if old is None:
+                continue
+            change = (value - old) / old * 100 if old else 0.0
+            worse = -change if _higher_is_better(metric) else change
+            flag = ''
+            if worse > args.threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            elif worse < -args.threshold:
+                flag = '  improved'
+            print(f'  {metric:<28} {old:>12} -> {value:>12}  {change:+7.1f}%{flag}')
+
+    if regressions:
+        print(f'{regressions} metrics regressed by more than {args.threshold}%')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Shared helpers for the benchmark scripts: percentiles and the JSON result envelope"""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of already sorted samples"""
+    if not sorted_samples:
+        return None
+    return sorted_samples[max(0, math.ceil(fraction * len(sorted_samples)) - 1)]
+
+
+def summarize(samples, scale=1e3, digits=3):
+    """count, mean, min, p50, p95, p99 and max of `samples` (seconds), scaled to ms by default"""
+    samples = sorted(samples)
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'mean': round(sum(samples) / len(samples) * scale, digits),
+        'min': round(samples[0] * scale, digits),
+        'p50': round(percentile(samples, 0.50) * scale, digits),
+        'p95': round(percentile(samples, 0.95) * scale, digits),
+        'p99': round(percentile(samples, 0.99) * scale, digits),
+        'max': round(samples[-1] * scale, digits),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    """Where and on what the results were measured, for comparing runs across commits"""
+    return {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def report(suite, results, json_output=False, output=None):
+    """Write the results envelope to `output` and/or stdout; returns it"""
+    document = {'suite': suite, 'environment': environment(), 'results': results}
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(document, file, indent=2)
+            file.write('\n')
+    if json_output:
+        json.dump(document, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    return document
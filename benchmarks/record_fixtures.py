@@ -0,0 +1,39 @@
+"""
+Refresh benchmarks/fixtures from the live IMD site: one station page and
+the nowcast page, saved exactly as served. Run occasionally (the pages
+change shape from time to time) and commit the result with a note of
+when it was recorded.
+
+    python benchmarks/record_fixtures.py [--station 43003]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import scraper  # noqa: E402
+import upstream  # noqa: E402
+from stub_server import FIXTURES_DIR  # noqa: E402
+
+
+def record(url, name):
+    response = upstream.get(url)
+    response.raise_for_status()
+    path = os.path.join(FIXTURES_DIR, name)
+    with open(path, 'wb') as file:
+        file.write(response.content)
+    print(f'{url} -> {path} ({len(response.content)} bytes)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--station', type=int, default=43003, help='station whose page is recorded')
+    args = parser.parse_args()
+
+    record(scraper.station_url(args.station), 'station.html')
+    record(scraper.alerts_url(), 'nowcast.html')
+
+
+if __name__ == '__main__':
+    main()
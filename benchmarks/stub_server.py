@@ -0,0 +1,151 @@
+"""
+Local stand-in for the IMD site: replays the recorded pages in
+benchmarks/fixtures with configurable latency, errors and timeouts, so
+benchmarks never touch the live site. Point the API at it with
+IMD_BASE_URL=http://127.0.0.1:<port>.
+
+    python benchmarks/stub_server.py [--port 8765] [--latency 0.2] [--jitter 0.1]
+                                     [--error-rate 0.05] [--timeout-rate 0.01]
+
+Station pages (any `?id=`) are served from station.html and the nowcast
+page from nowcast.html. Responses carry an ETag and honour If-None-Match,
+as IMD does, so conditional refetches come back as 304s.
+"""
+import argparse
+import hashlib
+import http.server
+import os
+import random
+import threading
+import time
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as file:
+        return file.read()
+
+
+class StubServer:
+    """
+    Threaded HTTP server replaying the fixtures. Behaviour can be changed
+    while it runs by assigning to the attributes:
+
+    - latency/jitter: seconds each response is delayed by (uniform jitter)
+    - error_rate: fraction of requests answered with a 500
+    - timeout_rate: fraction of requests that hang for `hang` seconds
+      before the connection is closed without a response
+    """
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0, timeout_rate=0.0, hang=60.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._pages = {}
+        for name in ('station.html', 'nowcast.html'):
+            body = load_fixture(name)
+            self._pages[name] = (body, '"%s"' % hashlib.sha1(body).hexdigest()[:16])
+
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; don't let Nagle hold the body back
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='imd-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handle(self, handler):
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+
+        if roll < self.timeout_rate:
+            time.sleep(self.hang)
+            handler.close_connection = True
+            return
+        if delay > 0:
+            time.sleep(delay)
+        if roll < self.timeout_rate + self.error_rate:
+            self._send(handler, 500, b'Internal Server Error')
+            return
+
+        body, etag = self._pages['station.html' if 'id=' in handler.path else 'nowcast.html']
+        if handler.headers.get('If-None-Match') == etag:
+            self._send(handler, 304, b'', etag)
+            return
+        self._send(handler, 200, body, etag)
+
+    @staticmethod
+    def _send(handler, status, body, etag=None):
+        handler.send_response(status)
+        if etag:
+            handler.send_header('ETag', etag)
+        if status != 304:
+            handler.send_header('Content-Type', 'text/html; charset=utf-8')
+            handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum extra random delay (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 500')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='fraction of requests that never get a response')
+    parser.add_argument('--hang', type=float, default=60.0, help='seconds a timed-out request is held open')
+    args = parser.parse_args()
+
+    stub = StubServer(args.port, args.latency, args.jitter, args.error_rate, args.timeout_rate, args.hang)
+    print(f'Serving IMD fixtures at {stub.url}')
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,206 @@
 # bl.py
+import hashlib
 import json
-import scraper
-import logging
+import os
+import sqlite3
+import threading
+import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import alerts
+import history
+import metrics
+import serializer
+import stations
+import stream
+import logging
+from cache import Fetched, TTLCache, is_error_result
+from store import SnapshotStore
+from refresher import Refresher
 
 logger = logging.getLogger(__name__)
 
+# scraper, async_scraper and upstream (requests, BeautifulSoup, aiohttp) are
+# imported where they are first needed, so web processes answering from the
+# caches or the snapshot store start without loading them
+
+# Weather cache settings (seconds), overridable from the environment
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', 900))
+WEATHER_CACHE_STALE_TTL = int(os.getenv('WEATHER_CACHE_STALE_TTL', 3600))
+WEATHER_CACHE_ERROR_TTL = int(os.getenv('WEATHER_CACHE_ERROR_TTL', 30))
+WEATHER_CACHE_MAX_SIZE = int(os.getenv('WEATHER_CACHE_MAX_SIZE', 256))
+# Per-station TTL overrides, e.g. "43003=300,43057=1800"
+WEATHER_CACHE_TTL_OVERRIDES = {
+    int(station_id): int(ttl)
+    for station_id, ttl in (
+        item.split('=') for item in os.getenv('WEATHER_CACHE_TTL_OVERRIDES', '').split(',') if item.strip()
+    )
+}
+
+# Background weather refresh; an interval of 0 disables it
+WEATHER_REFRESH_INTERVAL = int(os.getenv('WEATHER_REFRESH_INTERVAL', 0))
+WEATHER_REFRESH_WORKERS = int(os.getenv('WEATHER_REFRESH_WORKERS', 4))
+WEATHER_REFRESH_JITTER = float(os.getenv('WEATHER_REFRESH_JITTER', 2))
+
+# Threads streaming a bulk weather request; read here rather than from
+# async_scraper so worker mode never imports the scraper
+BATCH_CONCURRENCY = int(os.getenv('ASYNC_FETCH_CONCURRENCY', 10))
+
+# Cache-Control max-age for station details, which only change with stations.json
+STATION_MAX_AGE = int(os.getenv('STATION_MAX_AGE', 3600))
+
+# 'inline' fetches from IMD in the web process on a cache miss; 'worker' only
+# reads snapshots published by worker.py and never calls IMD
+SCRAPE_MODE = os.getenv('SCRAPE_MODE', 'inline')
+
+# Alerts snapshot settings (seconds)
+ALERTS_REFRESH_INTERVAL = int(os.getenv('ALERTS_REFRESH_INTERVAL', 300))
+ALERTS_STALE_TTL = int(os.getenv('ALERTS_STALE_TTL', 3600))
+ALERTS_ERROR_TTL = int(os.getenv('ALERTS_ERROR_TTL', 30))
+
+def _weather_ttl(id):
+    return WEATHER_CACHE_TTL_OVERRIDES.get(id, WEATHER_CACHE_TTL)
+
+snapshot_store = SnapshotStore()
+
+def _from_store(value, fetched_at):
+    return Fetched(value, fetched_at) if fetched_at else value
+
+def _read_store(key):
+    """The published snapshot for `key`, however old, or an error if there is none yet"""
+    try:
+        stored = snapshot_store.get(key)
+    except sqlite3.Error as e:
+        logger.error("Snapshot store unavailable for %s: %s", key, e)
+        stored = None
+    if stored is None:
+        return {
+            'error': 'No data published yet by the scrape worker',
+            'code': 503
+        }
+    return _from_store(*stored)
+
+def _load_through_store(key, max_age, fetch):
+    """Serve `key` from the shared snapshot store, refreshing it if it is too old"""
+    if SCRAPE_MODE == 'worker':
+        return _read_store(key)
+    try:
+        return _from_store(*snapshot_store.load_through(key, max_age, fetch, is_error_result))
+    except sqlite3.Error as e:
+        logger.error("Snapshot store unavailable for %s: %s", key, e)
+        return fetch()
+
+async def _aload_through_store(key, max_age, fetch):
+    if SCRAPE_MODE == 'worker':
+        return _read_store(key)
+    try:
+        return _from_store(*await snapshot_store.aload_through(key, max_age, fetch, is_error_result))
+    except sqlite3.Error as e:
+        logger.error("Snapshot store unavailable for %s: %s", key, e)
+        return await fetch()
+
+def _fetch_station_weather(id):
+    import scraper
+    data = scraper.get_station_data(id)
+    if not is_error_result(data):
+        history.record(id, data)
+    return data
+
+def _fetch_stations_weather(ids):
+    import async_scraper
+    results = async_scraper.get_stations_data(ids)
+    for id, data in results.items():
+        if not is_error_result(data):
+            history.record(id, data)
+    return results
+
+def _load_station_weather(id):
+    return _load_through_store(f'weather:{id}', _weather_ttl(id), lambda: _fetch_station_weather(id))
+
+async def _aload_station_weather(id, session):
+    async def fetch():
+        import async_scraper
+        data = await async_scraper.fetch_station(session, id)
+        if not is_error_result(data):
+            history.record(id, data)
+        return data
+    return await _aload_through_store(f'weather:{id}', _weather_ttl(id), fetch)
+
+def _bulk_load_station_weather(ids):
+    if SCRAPE_MODE == 'worker':
+        return {id: _read_store(f'weather:{id}') for id in ids}
+    try:
+        loaded = snapshot_store.load_many_through(
+            {f'weather:{id}': id for id in ids},
+            _weather_ttl,
+            _fetch_stations_weather,
+            is_error_result
+        )
+        return {id: _from_store(*loaded[id]) for id in ids}
+    except sqlite3.Error as e:
+        logger.error("Snapshot store unavailable for bulk weather: %s", e)
+        return _fetch_stations_weather(ids)
+
+weather_cache = TTLCache(
+    _load_station_weather,
+    ttl=WEATHER_CACHE_TTL,
+    max_size=WEATHER_CACHE_MAX_SIZE,
+    stale_ttl=WEATHER_CACHE_STALE_TTL,
+    error_ttl=WEATHER_CACHE_ERROR_TTL,
+    ttl_for=_weather_ttl,
+    name='weather'
+)
+
+weather_refresher = Refresher(
+    lambda: [station['stationId'] for station in stations.get_all()],
+    weather_cache.refresh,
+    interval=WEATHER_REFRESH_INTERVAL,
+    workers=WEATHER_REFRESH_WORKERS,
+    jitter=WEATHER_REFRESH_JITTER,
+    name='weather-refresher'
+)
+
+def start_background_refresh():
+    if WEATHER_REFRESH_INTERVAL > 0 and SCRAPE_MODE != 'worker':
+        weather_refresher.start()
+
+def get_refresher_status():
+    if SCRAPE_MODE == 'worker':
+        return _worker_status()
+    return {
+        'code': 200,
+        'result': weather_refresher.status()
+    }
+
+def _worker_status():
+    try:
+        stored = snapshot_store.get('worker:status')
+    except sqlite3.Error as e:
+        logger.error("Snapshot store unavailable for worker status: %s", e)
+        stored = None
+    if stored is None:
+        return {
+            'code': 503,
+            'msg': 'The scrape worker has not reported yet'
+        }
+    status, updated = stored
+    return {
+        'code': 200,
+        'result': {**status, 'age': round(time.time() - updated, 3)}
+    }
+
+def get_upstream_status():
+    import upstream
+    return {
+        'code': 200,
+        'result': upstream.status()
+    }
+
 def get_all_stations():
     try:
-        with open('stations.json', 'r') as file:
-            file_data = json.load(file)
         return {
             'code': 200,
-            'result': file_data
+            'result': stations.get_all()
         }
     except FileNotFoundError:
         logger.error("stations.json file not found")
@@ -27,145 +215,647 @@ def get_all_stations():
             'msg': 'Error reading station data'
         }
 
+@metrics.stage_seconds.timed('bl.get_all_stations_json')
+def get_all_stations_json():
+    """Return the pre-serialized /station/all body and its status code"""
+    try:
+        return stations.get_all_json(), 200
+    except Exception:
+        result = get_all_stations()
+        return serializer.dumps(result), result['code']
+
 def get_station_by_id(id):
     try:
-        with open('stations.json', 'r') as file:
-            file_data = json.load(file)
-        
-        for station in file_data:
-            if station['stationId'] == id:
-                return {
-                    'code': 200,
-                    'result': station
-                }
+        station = stations.get(id)
+        if station is not None:
+            return {
+                'code': 200,
+                'result': station
+            }
         
         return {
             'code': 404,
             'msg': f'No station with ID {id} found'
         }
     except Exception as e:
-        logger.error(f"Error in get_station_by_id: {str(e)}")
+        logger.error("Error in get_station_by_id: %s", e)
+        return {
+            'code': 500,
+            'msg': f'Error retrieving station data: {str(e)}'
+        }
+
+def get_stations_by_region(region):
+    """Stations whose region or jurisdiction matches the given name"""
+    try:
+        matches = stations.get_by_region(region) or stations.get_by_jurisdiction(region)
+        if not matches:
+            return {
+                'code': 404,
+                'msg': f'No stations found for region: {region}'
+            }
+        return {
+            'code': 200,
+            'result': matches
+        }
+    except Exception as e:
+        logger.error("Error in get_stations_by_region: %s", e)
         return {
             'code': 500,
             'msg': f'Error retrieving station data: {str(e)}'
         }
 
+def _weather_stale(id, info):
+    """True if the weather served for `id` is older than its TTL, e.g. while IMD is unreachable"""
+    return info is not None and time.time() - info[0] > _weather_ttl(id)
+
+def _alerts_stale(snapshot):
+    return time.time() - snapshot.fetched_at > ALERTS_REFRESH_INTERVAL
+
+def _weather_response(id, data, info):
+    response = {
+        'code': 200,
+        'result': data
+    }
+    if _weather_stale(id, info):
+        response['stale'] = True
+    return response
+
+def _error_response(data):
+    return {
+        'code': data.get('code', 500),
+        'msg': data['error']
+    }
+
+@metrics.stage_seconds.timed('bl.get_station_weather')
 def get_station_weather(id):
+    """(result, HTTP validators), both taken from the same cached weather"""
     try:
         # First verify if station exists
         station_info = get_station_by_id(id)
         if station_info['code'] == 404:
-            return station_info
+            return station_info, None
         
-        data = scraper.get_station_data(id)
+        weather_refresher.record_request(id)
+        data, info = weather_cache.get_with_info(id)
         if 'error' in data:
             return {
                 'code': data.get('code', 500),
                 'msg': data['error']
-            }
+            }, None
             
+        return _weather_response(id, data, info), _weather_validators([id], {id: info})
+    except Exception as e:
+        logger.error("Error in get_station_weather: %s", e)
+        return {
+            'code': 500,
+            'msg': f'Error retrieving weather data: {str(e)}'
+        }, None
+
+@metrics.stage_seconds.timed('bl.get_station_weather_async')
+async def get_station_weather_async(id, session):
+    """get_station_weather for the ASGI app: misses are fetched on the aiohttp `session`"""
+    try:
+        if stations.get(id) is None:
+            return {
+                'code': 404,
+                'msg': f'No station with ID {id} found'
+            }, None
+        weather_refresher.record_request(id)
+        data, info = await weather_cache.aget_with_info(id, lambda id: _aload_station_weather(id, session))
+        if 'error' in data:
+            return _error_response(data), None
+        return _weather_response(id, data, info), _weather_validators([id], {id: info})
+    except Exception as e:
+        logger.error("Error in get_station_weather_async: %s", e)
+        return {
+            'code': 500,
+            'msg': f'Error retrieving weather data: {str(e)}'
+        }, None
+
+@metrics.stage_seconds.timed('bl.get_bulk_station_weather')
+def get_bulk_station_weather(ids):
+    """
+    Weather for several stations in one call. Cache misses are fetched
+    concurrently; each station gets its own code/result or code/msg.
+    Returns (result, HTTP validators for the whole batch).
+    """
+    try:
+        known = [id for id in ids if stations.get(id) is not None]
+        for id in known:
+            weather_refresher.record_request(id)
+        data = weather_cache.get_many_with_info(known, _bulk_load_station_weather)
+
+        results = {}
+        for id in ids:
+            if id not in data:
+                results[str(id)] = {
+                    'code': 404,
+                    'msg': f'No station with ID {id} found'
+                }
+            elif 'error' in data[id][0]:
+                results[str(id)] = _error_response(data[id][0])
+            else:
+                results[str(id)] = _weather_response(id, *data[id])
+        infos = {id: info for id, (_, info) in data.items()}
         return {
             'code': 200,
-            'result': data
-        }
+            'result': results
+        }, _weather_validators(ids, infos, batch=True)
     except Exception as e:
-        logger.error(f"Error in get_station_weather: {str(e)}")
+        logger.error("Error in get_bulk_station_weather: %s", e)
         return {
             'code': 500,
             'msg': f'Error retrieving weather data: {str(e)}'
-        }
+        }, None
+
+# Bucket sizes (seconds) for downsampled history; 'day' is served from the daily index
+HISTORY_RESOLUTIONS = {'raw': None, 'hour': 3600, 'day': 86400}
 
-def get_weather_alerts():
+@metrics.stage_seconds.timed('bl.get_station_history')
+def get_station_history(id, start, end, resolution='raw'):
+    """Observations recorded for a station between two epoch timestamps"""
     try:
-        data = scraper.get_alerts()
-        if 'error' in data:
+        station_info = get_station_by_id(id)
+        if station_info['code'] == 404:
+            return station_info
+        if resolution not in HISTORY_RESOLUTIONS:
             return {
-                'code': data.get('code', 500),
-                'msg': data['error']
+                'code': 400,
+                'msg': f'Invalid resolution, expected one of: {", ".join(HISTORY_RESOLUTIONS)}'
             }
+
+        station_history = history.for_station(id)
+        if resolution == 'raw':
+            records = station_history.raw(start, end)
+        elif resolution == 'day':
+            records = station_history.daily_aggregates(start, end)
+        else:
+            records = station_history.downsample(start, end, HISTORY_RESOLUTIONS[resolution])
+
         return {
             'code': 200,
-            'result': data
+            'result': {
+                'stationId': id,
+                'resolution': resolution,
+                'start': datetime.fromtimestamp(start, history.IST).isoformat(),
+                'end': datetime.fromtimestamp(end, history.IST).isoformat(),
+                'records': records,
+                'forecasts': station_history.issued_forecasts(start, end)
+            }
         }
     except Exception as e:
-        logger.error(f"Error in get_weather_alerts: {str(e)}")
+        logger.error("Error in get_station_history: %s", e)
+        return {
+            'code': 500,
+            'msg': f'Error retrieving station history: {str(e)}'
+        }
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+def _batch_executor():
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ThreadPoolExecutor(
+                max_workers=BATCH_CONCURRENCY,
+                thread_name_prefix='batch'
+            )
+    return _batch_pool
+
+def iter_bulk_station_weather(ids):
+    """Yield (id, result) pairs in the order each station's weather becomes available"""
+    pool = _batch_executor()
+    futures = {pool.submit(get_station_weather, id): id for id in ids}
+    for future in as_completed(futures):
+        yield futures[future], future.result()[0]
+
+def _alerts_version(data, fetched_at):
+    """
+    Version of this alerts content shared by every process: the fetch time
+    of the first copy stored, so a refresh that changes nothing keeps it.
+    None (each process uses its own fetch time) if the store is unavailable.
+    """
+    if is_error_result(data):
+        return None
+    fingerprint = hashlib.sha1(serializer.dumps(data)).hexdigest()
+    try:
+        stored = snapshot_store.get('alerts:version')
+        if stored is not None and stored[0]['fingerprint'] == fingerprint:
+            return stored[0]['version']
+        version = int((fetched_at or time.time()) * 1000)
+        snapshot_store.put('alerts:version', {'fingerprint': fingerprint, 'version': version})
+        return version
+    except sqlite3.Error as e:
+        logger.error("Snapshot store unavailable for the alerts version: %s", e)
+        return None
+
+def _build_alerts_snapshot(data):
+    # Built against the snapshot it replaces so only changed states are redone
+    previous = alerts_cache.peek('alerts')
+    if isinstance(data, Fetched):
+        version = _alerts_version(data.value, data.fetched_at)
+        return Fetched(alerts.build_snapshot(data.value, data.fetched_at, previous, version), data.fetched_at)
+    return alerts.build_snapshot(data, previous=previous, version=_alerts_version(data, None))
+
+def _fetch_alerts():
+    import scraper
+    return scraper.get_alerts()
+
+def _load_alerts_snapshot(key):
+    return _build_alerts_snapshot(_load_through_store('alerts', ALERTS_REFRESH_INTERVAL, _fetch_alerts))
+
+alerts_cache = TTLCache(
+    _load_alerts_snapshot,
+    ttl=ALERTS_REFRESH_INTERVAL,
+    max_size=1,
+    stale_ttl=ALERTS_STALE_TTL,
+    error_ttl=ALERTS_ERROR_TTL,
+    name='alerts'
+)
+
+def _snapshot_ages():
+    ages = {('weather', str(id)): age for id, age in weather_cache.ages().items()}
+    ages.update({('alerts', 'all'): age for age in alerts_cache.ages().values()})
+    return ages
+
+metrics.snapshot_age.collect = _snapshot_ages
+
+def warm():
+    """
+    Fill the caches from the snapshot store without calling IMD. Under
+    gunicorn with preload_app this runs once in the master, so every forked
+    worker starts with the data already in (shared) memory.
+    """
+    try:
+        stored = snapshot_store.latest('weather:', WEATHER_CACHE_MAX_SIZE)
+        stored_alerts = snapshot_store.get('alerts')
+    except sqlite3.Error as e:
+        logger.error("Snapshot store unavailable for warm-up: %s", e)
+        return
+    # Oldest first, so the newest end up most recently used
+    for key, (data, fetched_at) in reversed(list(stored.items())):
+        weather_cache.put(int(key.split(':', 1)[1]), data, fetched_at)
+    if stored_alerts is not None:
+        data, fetched_at = stored_alerts
+        alerts_cache.put('alerts', _build_alerts_snapshot(Fetched(data, fetched_at)).value, fetched_at)
+    logger.info("Warmed caches with %s stations' weather and %s alerts",
+                len(stored), 'the' if stored_alerts is not None else 'no')
+
+_warming = None
+
+def _warm_alerts():
+    """Load the alerts snapshot in the background, once at a time"""
+    global _warming
+    if _warming is None or not _warming.is_alive():
+        _warming = threading.Thread(target=get_alerts_snapshot, name='alerts-warm-up', daemon=True)
+        _warming.start()
+
+def get_readiness():
+    """
+    Ready once the station registry and an alerts snapshot are in memory.
+    Weather is counted but not required, as it is cached per station on
+    demand. While not ready, the alerts are loaded in the background.
+    """
+    snapshot = alerts_cache.peek('alerts')
+    has_alerts = isinstance(snapshot, alerts.AlertsSnapshot)
+    if not stations.is_loaded() or not has_alerts:
+        if not has_alerts:
+            _warm_alerts()
+        missing = [name for name, ok in (('stations', stations.is_loaded()), ('alerts', has_alerts)) if not ok]
+        return {
+            'code': 503,
+            'msg': f'Warming up, not yet loaded: {", ".join(missing)}'
+        }
+    return {
+        'code': 200,
+        'result': {
+            'ready': True,
+            'pid': os.getpid(),
+            'stations': len(stations.get_all()),
+            'alerts_version': snapshot.version,
+            'weather_cached': len(weather_cache)
+        }
+    }
+
+@metrics.stage_seconds.timed('bl.get_alerts_snapshot')
+def get_alerts_snapshot():
+    """Return the current AlertsSnapshot, or the scraper's error dict"""
+    return alerts_cache.get('alerts')
+
+def _alerts_snapshot():
+    """(get_alerts_snapshot(), its cache info) from one lookup, for responses with validators"""
+    return alerts_cache.get_with_info('alerts')
+
+async def _aload_alerts_snapshot(session):
+    async def fetch():
+        import async_scraper
+        return await async_scraper.fetch_alerts(session)
+    data = await _aload_through_store('alerts', ALERTS_REFRESH_INTERVAL, fetch)
+    return _build_alerts_snapshot(data)
+
+@metrics.stage_seconds.timed('bl.get_alerts_snapshot_async')
+async def get_alerts_snapshot_async(session):
+    """
+    get_alerts_snapshot for the ASGI app. Once awaited, the sync alerts
+    functions are served from the cache without blocking.
+    """
+    return await alerts_cache.aget('alerts', lambda key: _aload_alerts_snapshot(session))
+
+# Last snapshot the alerts stream published a diff against
+_streamed_snapshot = None
+
+def _poll_alert_changes():
+    """Encoded diff event if the alerts snapshot changed since the last poll"""
+    global _streamed_snapshot
+    snapshot = get_alerts_snapshot()
+    if isinstance(snapshot, dict):
+        return None
+    previous, _streamed_snapshot = _streamed_snapshot, snapshot
+    if previous is None or previous.version == snapshot.version:
+        return None
+    diff = alerts.diff_snapshots(previous, snapshot)
+    if not diff['states']:
+        return None
+    return stream.sse_event(diff, event='diff', id=snapshot.version)
+
+alerts_broadcaster = stream.Broadcaster(_poll_alert_changes, name='alerts-stream')
+
+def subscribe_alert_changes(max_clients=None, loop=None):
+    """
+    Return (subscriber, opening event) for a new alerts stream client, or
+    (None, None) when the stream is at capacity (see Broadcaster.subscribe).
+    The opening event carries the current version and summary; later
+    events are diffs against it.
+    """
+    global _streamed_snapshot
+    subscriber = alerts_broadcaster.subscribe(max_clients, loop)
+    if subscriber is None:
+        return None, None
+    snapshot = get_alerts_snapshot()
+    if isinstance(snapshot, dict):
+        return subscriber, stream.sse_event({'version': None, 'error': snapshot['error']}, event='snapshot')
+    if _streamed_snapshot is None:
+        _streamed_snapshot = snapshot
+    opening = {'version': snapshot.version, 'summary': snapshot.summary}
+    return subscriber, stream.sse_event(opening, event='snapshot', id=snapshot.version)
+
+def unsubscribe_alert_changes(subscriber):
+    alerts_broadcaster.unsubscribe(subscriber)
+
+def _alerts_response(snapshot, result):
+    response = {
+        'code': 200,
+        'result': result
+    }
+    if _alerts_stale(snapshot):
+        response['stale'] = True
+    return response
+
+def get_weather_alerts(snapshot=None):
+    try:
+        if snapshot is None:
+            snapshot = get_alerts_snapshot()
+        if isinstance(snapshot, dict):
+            return _error_response(snapshot)
+        return _alerts_response(snapshot, {**snapshot.data, 'version': snapshot.version})
+    except Exception as e:
+        logger.error("Error in get_weather_alerts: %s", e)
         return {
             'code': 500,
             'msg': f'Error retrieving alert data: {str(e)}'
         }
 
-def get_state_alerts(state):
+@metrics.stage_seconds.timed('bl.get_weather_alerts_json')
+def get_weather_alerts_json():
+    """Pre-serialized /alerts body, status code and HTTP validators, all from one snapshot"""
+    snapshot, info = None, None
     try:
-        data = scraper.get_alerts()
-        if 'error' in data:
-            return {
-                'code': data.get('code', 500),
-                'msg': data['error']
-            }
+        snapshot, info = _alerts_snapshot()
+        if not isinstance(snapshot, dict) and not _alerts_stale(snapshot):
+            return snapshot.alerts_json, 200, _alerts_validators(snapshot, info, 'all')
+    except Exception:
+        pass
+    result = get_weather_alerts(snapshot)
+    return serializer.dumps(result), result['code'], _alerts_validators(snapshot, info, 'all')
+
+def get_alert_changes(since):
+    """
+    Change log entries after version `since`. `complete` is False when
+    `since` is older than the log, in which case the client should fetch
+    /alerts again. Returns (result, HTTP validators).
+    """
+    try:
+        since = int(since)
+    except (TypeError, ValueError):
+        return {
+            'code': 400,
+            'msg': 'since must be an alerts version'
+        }, None
+    try:
+        snapshot, info = _alerts_snapshot()
+        if isinstance(snapshot, dict):
+            return _error_response(snapshot), None
+        changes = snapshot.changes_since(since)
+        return _alerts_response(snapshot, {
+            'since': since,
+            'version': snapshot.version,
+            'complete': changes is not None,
+            'changes': changes or []
+        }), _alerts_validators(snapshot, info, 'changes', str(since))
+    except Exception as e:
+        logger.error("Error in get_alert_changes: %s", e)
+        return {
+            'code': 500,
+            'msg': f'Error retrieving alert changes: {str(e)}'
+        }, None
+
+def get_state_alerts(state, snapshot=None):
+    try:
+        if snapshot is None:
+            snapshot = get_alerts_snapshot()
+        if isinstance(snapshot, dict):
+            return _error_response(snapshot)
         
         # Get alerts for specific state
         state = state.lower()
-        state_alerts = data.get('alerts_by_state', {}).get(state, [])
-        
-        if not state_alerts:
+        if state not in snapshot.by_state:
             return {
                 'code': 404,
                 'msg': f'No alerts found for state: {state}'
             }
         
+        return _alerts_response(snapshot, snapshot.state_result(state))
+    except Exception as e:
+        logger.error("Error in get_state_alerts: %s", e)
         return {
-            'code': 200,
-            'result': {
-                'state': state,
-                'alerts': state_alerts,
-                'total_alerts': len(state_alerts),
-                'last_updated': data.get('last_updated')
-            }
+            'code': 500,
+            'msg': f'Error retrieving state alert data: {str(e)}'
         }
+
+@metrics.stage_seconds.timed('bl.get_state_alerts_json')
+def get_state_alerts_json(state):
+    """Pre-serialized /alerts/state/<state> body, status code and HTTP validators, all from one snapshot"""
+    snapshot, info = None, None
+    try:
+        snapshot, info = _alerts_snapshot()
+        if not isinstance(snapshot, dict) and not _alerts_stale(snapshot):
+            body = snapshot.state_json.get(state.lower())
+            if body is not None:
+                return body, 200, _alerts_validators(snapshot, info, 'state', state)
+    except Exception:
+        pass
+    result = get_state_alerts(state, snapshot)
+    return serializer.dumps(result), result['code'], _alerts_validators(snapshot, info, 'state', state)
+
+def get_alerts_summary(snapshot=None):
+    try:
+        if snapshot is None:
+            snapshot = get_alerts_snapshot()
+        if isinstance(snapshot, dict):
+            return _error_response(snapshot)
+        return _alerts_response(snapshot, snapshot.summary)
     except Exception as e:
-        logger.error(f"Error in get_state_alerts: {str(e)}")
+        logger.error("Error in get_alerts_summary: %s", e)
         return {
             'code': 500,
-            'msg': f'Error retrieving state alert data: {str(e)}'
+            'msg': f'Error retrieving alerts summary: {str(e)}'
         }
 
-def get_alerts_summary():
+@metrics.stage_seconds.timed('bl.get_alerts_summary_json')
+def get_alerts_summary_json():
+    """Pre-serialized /alerts/summary body, status code and HTTP validators, all from one snapshot"""
+    snapshot, info = None, None
     try:
-        data = scraper.get_alerts()
-        if 'error' in data:
-            return {
-                'code': data.get('code', 500),
-                'msg': data['error']
+        snapshot, info = _alerts_snapshot()
+        if not isinstance(snapshot, dict) and not _alerts_stale(snapshot):
+            return snapshot.summary_json, 200, _alerts_validators(snapshot, info, 'summary')
+    except Exception:
+        pass
+    result = get_alerts_summary(snapshot)
+    return serializer.dumps(result), result['code'], _alerts_validators(snapshot, info, 'summary')
+
+@metrics.stage_seconds.timed('bl.get_nearest_stations')
+def get_nearest_stations(lat, lng, count):
+    try:
+        return {
+            'code': 200,
+            'result': {
+                'lat': lat,
+                'lng': lng,
+                'stations': [
+                    {**station, 'distance_km': round(distance, 2)}
+                    for station, distance in stations.nearest(lat, lng, count)
+                ]
             }
-        
-        # Count alerts by level
-        alert_levels = {
-            'No Warning': 0,
-            'Watch': 0,
-            'Alert': 0,
-            'Warning': 0
-        }
-        
-        for alert in data.get('alerts', []):
-            level = alert.get('alert_level', 'Unknown')
-            if level in alert_levels:
-                alert_levels[level] += 1
-        
-        summary = {
-            'total_alerts': len(data.get('alerts', [])),
-            'states_affected': len(data.get('alerts_by_state', {})),
-            'alert_levels': alert_levels,
-            'last_updated': data.get('last_updated'),
-            'timestamp': datetime.now().isoformat()
         }
-        
+    except Exception as e:
+        logger.error("Error in get_nearest_stations: %s", e)
         return {
-            'code': 200,
-            'result': summary
+            'code': 500,
+            'msg': f'Error retrieving station data: {str(e)}'
         }
+
+@metrics.stage_seconds.timed('bl.get_alerts_within_radius')
+def get_alerts_within_radius(lat, lng, radius_km):
+    """(result, HTTP validators) for the alerts within `radius_km` of a point"""
+    try:
+        snapshot, info = _alerts_snapshot()
+        if isinstance(snapshot, dict):
+            return _error_response(snapshot), None
+        positions, distances = snapshot.geo.within_radius(lat, lng, radius_km)
+        matches = [
+            {**snapshot.alerts[position], 'distance_km': round(float(distance), 2)}
+            for position, distance in zip(positions, distances)
+        ]
+        return _alerts_response(snapshot, {
+            'lat': lat,
+            'lng': lng,
+            'radius_km': radius_km,
+            'alerts': matches,
+            'total_alerts': len(matches),
+            'last_updated': snapshot.last_updated
+        }), _alerts_validators(snapshot, info, 'nearby', f'{lat}-{lng}-{radius_km}')
     except Exception as e:
-        logger.error(f"Error in get_alerts_summary: {str(e)}")
+        logger.error("Error in get_alerts_within_radius: %s", e)
         return {
             'code': 500,
-            'msg': f'Error retrieving alerts summary: {str(e)}'
-        }
\ No newline at end of file
+            'msg': f'Error retrieving alert data: {str(e)}'
+        }, None
+
+@metrics.stage_seconds.timed('bl.get_alerts_in_bbox')
+def get_alerts_in_bbox(min_lat, min_lng, max_lat, max_lng):
+    """(result, HTTP validators) for the alerts inside a bounding box"""
+    try:
+        snapshot, info = _alerts_snapshot()
+        if isinstance(snapshot, dict):
+            return _error_response(snapshot), None
+        matches = [snapshot.alerts[position] for position in snapshot.geo.within_bbox(min_lat, min_lng, max_lat, max_lng)]
+        return _alerts_response(snapshot, {
+            'bbox': {'min_lat': min_lat, 'min_lng': min_lng, 'max_lat': max_lat, 'max_lng': max_lng},
+            'alerts': matches,
+            'total_alerts': len(matches),
+            'last_updated': snapshot.last_updated
+        }), _alerts_validators(snapshot, info, 'bbox', f'{min_lat}-{min_lng}-{max_lat}-{max_lng}')
+    except Exception as e:
+        logger.error("Error in get_alerts_in_bbox: %s", e)
+        return {
+            'code': 500,
+            'msg': f'Error retrieving alert data: {str(e)}'
+        }, None
+
+# HTTP validators: each returns (etag, last_modified, max_age) describing the
+# data behind a response, or None when it should not be cached
+
+def get_stations_validators(id=None, query=None):
+    index = stations.get_index()
+    version = int(index.mtime * 1000)
+    if query is not None:
+        etag = f'stations-{query}-{version}'
+    else:
+        etag = f'stations-{version}' if id is None else f'station-{id}-{version}'
+    return etag, index.mtime, STATION_MAX_AGE
+
+def _weather_validators(ids, infos, batch=False):
+    """
+    Validators for the weather of `ids`, from the cache `infos` ({id: info}
+    for the known stations) of the values actually served. A `batch`
+    response has its own ETag, built from every requested ID including
+    unknown ones, since its body differs from /weather/<id> even for a
+    single station.
+    """
+    if not infos or None in infos.values():
+        return None
+
+    def version(id):
+        if id not in infos:
+            return f'{id}:unknown'
+        # Stale responses carry a flag in the body, so they get their own ETag
+        return f'{id}:{int(infos[id][0] * 1000)}' + ('-stale' if _weather_stale(id, infos[id]) else '')
+
+    versions = ','.join(version(id) for id in ids)
+    if batch:
+        etag = f'weather-batch-{hashlib.sha1(versions.encode()).hexdigest()[:20]}'
+    else:
+        etag = f'weather-{versions.replace(":", "-")}'
+    last_modified = max(fetched_at for fetched_at, _ in infos.values())
+    max_age = min(remaining for _, remaining in infos.values())
+    return etag, last_modified, max_age
+
+def _alerts_validators(snapshot, info, kind, detail=None):
+    """Validators for a response built from `snapshot`, with `info` from the same cache lookup"""
+    if snapshot is None or isinstance(snapshot, dict) or info is None:
+        return None
+    name = kind if detail is None else f'{kind}-{detail.lower()}'
+    version = f'{snapshot.version}-stale' if _alerts_stale(snapshot) else snapshot.version
+    return f'alerts-{name}-{version}', snapshot.last_modified, info[1]
+
+def get_history_validators(id, start, end, resolution):
+    station_history = history.for_station(id)
+    station_history.sync()
+    count = len(station_history.timestamps)
+    if not count:
+        return None
+    etag = f'history-{id}-{resolution}-{int(start)}-{int(end)}-{count}-{len(station_history.forecasts)}'
+    info = weather_cache.info(id)
+    return etag, min(station_history.timestamps[-1], end), info[1] if info else 0
@@ -0,0 +1,365 @@
+# cache.py
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def is_error_result(value):
+    """Scraper functions report failures as a dict with an 'error' key"""
+    return isinstance(value, dict) and 'error' in value
+
+
+class Fetched:
+    """
+    Loader result for a value fetched earlier than now (e.g. read back from
+    disk), so its TTL counts from when it was actually fetched.
+    """
+    __slots__ = ('value', 'fetched_at')
+
+    def __init__(self, value, fetched_at):
+        self.value = value
+        self.fetched_at = fetched_at
+
+
+class _Entry:
+    __slots__ = ('value', 'fetched_at', 'expires_at', 'stale_until', 'is_error')
+
+    def __init__(self, value, fetched_at, expires_at, stale_until, is_error):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.is_error = is_error
+
+
+def _info(entry):
+    """(fetched_at, seconds until expiry) of a good entry, None for an error"""
+    if entry.is_error:
+        return None
+    return entry.fetched_at, max(0.0, entry.expires_at - time.monotonic())
+
+
+class _Flight:
+    """A load in progress that concurrent callers for the same key wait on"""
+    __slots__ = ('event', 'entry', 'raw', 'error', 'futures')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+        self.raw = None
+        self.error = None
+        # asyncio futures of callers awaiting this load from an event loop
+        self.futures = []
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with per-key TTLs in front of a loader function.
+
+    - Concurrent misses for the same key share a single loader call.
+    - Expired entries are served for up to `stale_ttl` more seconds while
+      one background refresh runs.
+    - Error results are cached for `error_ttl` seconds; if a good value
+      is still within its stale window it keeps being served instead.
+    """
+
+    def __init__(self, loader, ttl=600, max_size=256, stale_ttl=3600, error_ttl=30,
+                 ttl_for=None, is_error=is_error_result, name='cache'):
+        self.loader = loader
+        # Label for this cache's hit/stale/miss counts in metrics
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self.ttl_for = ttl_for or (lambda key: self.ttl)
+        self.is_error = is_error
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._get_entry(key).value
+
+    def get_with_info(self, key):
+        """
+        (value, info) for `key`, where info is what info() reports for that
+        same value, so the two cannot come from different refreshes
+        """
+        entry = self._get_entry(key)
+        return entry.value, _info(entry)
+
+    def _get_entry(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if now < entry.expires_at:
+                    metrics.cache_requests.inc(self.name, 'hit')
+                    return entry
+                if not entry.is_error and now < entry.stale_until:
+                    metrics.cache_requests.inc(self.name, 'stale')
+                    flight, leader = self._join(key)
+                    if leader:
+                        threading.Thread(
+                            target=self._load, args=(key, flight), daemon=True
+                        ).start()
+                    return entry
+
+            flight, leader = self._join(key)
+        metrics.cache_requests.inc(self.name, 'miss')
+        return self._wait(key, flight, leader)
+
+    async def aget(self, key, loader):
+        """
+        Form of get for callers on an asyncio event loop: misses and
+        background refreshes run `await loader(key)` instead of blocking a
+        thread. Loads are shared with concurrent sync and async callers.
+        """
+        return (await self._aget_entry(key, loader)).value
+
+    async def aget_with_info(self, key, loader):
+        """get_with_info for callers on an asyncio event loop, see aget"""
+        entry = await self._aget_entry(key, loader)
+        return entry.value, _info(entry)
+
+    async def _aget_entry(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if now < entry.expires_at:
+                    metrics.cache_requests.inc(self.name, 'hit')
+                    return entry
+                if not entry.is_error and now < entry.stale_until:
+                    metrics.cache_requests.inc(self.name, 'stale')
+                    flight, leader = self._join(key)
+                    if leader:
+                        task = asyncio.get_running_loop().create_task(self._aload(key, flight, loader))
+                        self._tasks.add(task)
+                        task.add_done_callback(self._tasks.discard)
+                    return entry
+
+            flight, leader = self._join(key)
+            if not leader:
+                future = asyncio.get_running_loop().create_future()
+                flight.futures.append(future)
+        metrics.cache_requests.inc(self.name, 'miss')
+
+        if leader:
+            await self._aload(key, flight, loader)
+        else:
+            await future
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.entry
+
+    def refresh(self, key):
+        """
+        Load `key` now, joining any load already in flight. Returns the
+        loader's own result, which may be an error even when a stale good
+        value is still being served from the cache.
+        """
+        with self._lock:
+            flight, leader = self._join(key)
+        self._wait(key, flight, leader)
+        return flight.raw
+
+    def get_many(self, keys, bulk_loader=None):
+        """
+        Look up several keys at once and return {key: value}. Misses that
+        no other caller is already loading are fetched with one call to
+        `bulk_loader(keys) -> {key: value}` (or `loader` per key if none is
+        given); stale entries are refreshed the same way in the background.
+        """
+        return {key: entry.value for key, entry in self._get_many_entries(keys, bulk_loader).items()}
+
+    def get_many_with_info(self, keys, bulk_loader=None):
+        """get_many returning {key: (value, info)}, see get_with_info"""
+        return {key: (entry.value, _info(entry)) for key, entry in self._get_many_entries(keys, bulk_loader).items()}
+
+    def _get_many_entries(self, keys, bulk_loader):
+        now = time.monotonic()
+        results = {}
+        to_load = {}
+        to_refresh = {}
+        to_wait = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    if now < entry.expires_at:
+                        metrics.cache_requests.inc(self.name, 'hit')
+                        results[key] = entry
+                        continue
+                    if not entry.is_error and now < entry.stale_until:
+                        metrics.cache_requests.inc(self.name, 'stale')
+                        results[key] = entry
+                        flight, leader = self._join(key)
+                        if leader:
+                            to_refresh[key] = flight
+                        continue
+
+                metrics.cache_requests.inc(self.name, 'miss')
+                flight, leader = self._join(key)
+                if leader:
+                    to_load[key] = flight
+                to_wait[key] = flight
+
+        if to_refresh:
+            threading.Thread(
+                target=self._load_many, args=(to_refresh, bulk_loader), daemon=True
+            ).start()
+        if to_load:
+            self._load_many(to_load, bulk_loader)
+
+        for key, flight in to_wait.items():
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            results[key] = flight.entry
+        return results
+
+    def put(self, key, value, fetched_at=None):
+        """Store a value loaded elsewhere (e.g. read back from disk at startup) as if `loader` had returned it"""
+        return self._store(key, value, fetched_at).value
+
+    def peek(self, key):
+        """Return the cached value for `key` without loading or touching LRU order"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry.value if entry is not None else None
+
+    def info(self, key):
+        """(fetched_at, seconds until expiry) of the cached value for `key`, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return _info(entry) if entry is not None else None
+
+    def ages(self):
+        """{key: seconds since fetched} for every cached good value"""
+        now = time.time()
+        with self._lock:
+            entries = list(self._entries.items())
+        return {key: now - entry.fetched_at for key, entry in entries if not entry.is_error}
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _join(self, key):
+        # Caller holds self._lock
+        flight = self._inflight.get(key)
+        if flight is not None:
+            return flight, False
+        flight = self._inflight[key] = _Flight()
+        return flight, True
+
+    def _wait(self, key, flight, leader):
+        if leader:
+            self._load(key, flight)
+        else:
+            flight.event.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.entry
+
+    def _load(self, key, flight):
+        self._load_many({key: flight})
+
+    def _load_many(self, flights, bulk_loader=None):
+        try:
+            if bulk_loader is None:
+                values = {key: self.loader(key) for key in flights}
+            else:
+                values = bulk_loader(list(flights))
+            self._complete(flights, values)
+        except Exception as e:
+            self._fail(flights, e)
+        finally:
+            self._release(flights)
+
+    async def _aload(self, key, flight, loader):
+        flights = {key: flight}
+        try:
+            self._complete(flights, {key: await loader(key)})
+        except Exception as e:
+            self._fail(flights, e)
+        finally:
+            self._release(flights)
+
+    def _complete(self, flights, values):
+        for key, flight in flights.items():
+            value = values[key]
+            fetched_at = None
+            if isinstance(value, Fetched):
+                value, fetched_at = value.value, value.fetched_at
+            flight.raw = value
+            flight.entry = self._store(key, value, fetched_at)
+
+    def _fail(self, flights, error):
+        logger.error("Error loading cache keys %s: %s", list(flights), error)
+        for flight in flights.values():
+            flight.error = error
+
+    def _release(self, flights):
+        with self._lock:
+            for key in flights:
+                self._inflight.pop(key, None)
+        for flight in flights.values():
+            flight.event.set()
+            # Async waiters may be on a different loop than the loader ran on
+            for future in flight.futures:
+                future.get_loop().call_soon_threadsafe(_resolve, future)
+
+    def _store(self, key, value, fetched_at=None):
+        now = time.monotonic()
+        is_error = self.is_error(value)
+        with self._lock:
+            previous = self._entries.get(key)
+            if is_error and previous is not None and not previous.is_error and now < previous.stale_until:
+                # Keep serving the last good value, but back off before retrying upstream
+                logger.warning("Refresh failed for %s, serving stale value", key)
+                previous.expires_at = now + self.error_ttl
+                return previous
+
+            if is_error:
+                expires_at = now + self.error_ttl
+                stale_until = expires_at
+            else:
+                ttl = self.ttl_for(key)
+                if fetched_at:
+                    # Values that are already old still get a short while before a retry
+                    ttl = max(ttl - (time.time() - fetched_at), min(ttl, self.error_ttl))
+                expires_at = now + ttl
+                stale_until = expires_at + self.stale_ttl
+
+            entry = self._entries[key] = _Entry(value, fetched_at or time.time(), expires_at, stale_until, is_error)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
@@ -0,0 +1,105 @@
+# geo.py
+import os
+
+import numpy as np
+
+# Side (degrees) of the grid cells points are bucketed into
+GEO_CELL_DEGREES = float(os.getenv('GEO_CELL_DEGREES', 0.5))
+
+EARTH_RADIUS_KM = 6371.0088
+_KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distance (km) from one point to each of `lats`/`lngs`"""
+    lat, lng = np.radians(lat), np.radians(lng)
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoIndex:
+    """
+    Uniform grid over a fixed set of points. Points are sorted by cell,
+    row-major, so the cells of one grid row inside a query box are a
+    single contiguous slice found with searchsorted. Queries return
+    positions in the `lats`/`lngs` sequences the index was built from.
+    """
+
+    def __init__(self, lats, lngs, cell=GEO_CELL_DEGREES):
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        # (0, 0) is what markers without coordinates are recorded as
+        valid = np.flatnonzero(np.isfinite(lats) & np.isfinite(lngs) & ((lats != 0) | (lngs != 0)))
+        self.cell = cell
+        self.size = len(valid)
+        if not self.size:
+            self.positions = valid
+            self.lats = self.lngs = np.empty(0)
+            self.keys = np.empty(0, dtype=np.int64)
+            return
+
+        self.lat0 = lats[valid].min()
+        self.lng0 = lngs[valid].min()
+        self.columns = int((lngs[valid].max() - self.lng0) // cell) + 1
+        self.rows = int((lats[valid].max() - self.lat0) // cell) + 1
+        keys = self._row(lats[valid]) * self.columns + self._column(lngs[valid])
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.positions = valid[order]
+        self.lats = lats[self.positions]
+        self.lngs = lngs[self.positions]
+
+    def __len__(self):
+        return self.size
+
+    def _row(self, lat):
+        return np.clip(((np.asarray(lat) - self.lat0) // self.cell).astype(np.int64), 0, self.rows - 1)
+
+    def _column(self, lng):
+        return np.clip(((np.asarray(lng) - self.lng0) // self.cell).astype(np.int64), 0, self.columns - 1)
+
+    def _candidates(self, min_lat, min_lng, max_lat, max_lng):
+        """Sorted-order slots of every point in the grid cells overlapping the box"""
+        if not self.size or max_lat < self.lat0 or max_lng < self.lng0 or \
+                min_lat > self.lat0 + self.rows * self.cell or min_lng > self.lng0 + self.columns * self.cell:
+            return np.empty(0, dtype=np.int64)
+        row_lo, row_hi = int(self._row(min_lat)), int(self._row(max_lat))
+        column_lo, column_hi = int(self._column(min_lng)), int(self._column(max_lng))
+        rows = np.arange(row_lo, row_hi + 1) * self.columns
+        starts = np.searchsorted(self.keys, rows + column_lo, side='left')
+        ends = np.searchsorted(self.keys, rows + column_hi, side='right')
+        if not len(rows):
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+    def within_bbox(self, min_lat, min_lng, max_lat, max_lng):
+        """Positions of the points inside the box, in grid order"""
+        slots = self._candidates(min_lat, min_lng, max_lat, max_lng)
+        lats, lngs = self.lats[slots], self.lngs[slots]
+        inside = (lats >= min_lat) & (lats <= max_lat) & (lngs >= min_lng) & (lngs <= max_lng)
+        return self.positions[slots[inside]]
+
+    def within_radius(self, lat, lng, radius_km):
+        """(positions, distances) of the points within `radius_km`, nearest first"""
+        dlat = radius_km / _KM_PER_DEGREE
+        # Longitude degrees shrink towards the poles; widen the box to match
+        dlng = dlat / max(np.cos(np.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        slots = self._candidates(lat - dlat, lng - dlng, lat + dlat, lng + dlng)
+        distances = haversine_km(lat, lng, self.lats[slots], self.lngs[slots])
+        inside = np.flatnonzero(distances <= radius_km)
+        order = inside[np.argsort(distances[inside], kind='stable')]
+        return self.positions[slots[order]], distances[order]
+
+    def nearest(self, lat, lng, count):
+        """(positions, distances) of the `count` points nearest to lat/lng, nearest first"""
+        count = min(count, self.size)
+        if count <= 0:
+            return self.positions[:0], np.empty(0)
+        distances = haversine_km(lat, lng, self.lats, self.lngs)
+        if count < self.size:
+            slots = np.argpartition(distances, count - 1)[:count]
+        else:
+            slots = np.arange(self.size)
+        slots = slots[np.argsort(distances[slots], kind='stable')]
+        return self.positions[slots], distances[slots]
@@ -0,0 +1,35 @@
+# gunicorn.conf.py
+# Production WSGI server settings, picked up automatically by
+#
+#   gunicorn app:app
+#
+# The app is imported once in the master: heavy modules, the station
+# registry and the last published snapshots (bl.warm) are loaded before
+# forking, so each worker starts with them in copy-on-write shared memory
+# and is ready as soon as it is forked.
+import gc
+import os
+
+# $PORT is set by platforms such as Heroku that choose the port
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:%s' % os.getenv('PORT', 1875))
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+# Threads per worker, shared with app.py's limit on /alerts/stream clients
+threads = int(os.getenv('SERVER_THREADS', 16))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+
+# Import the app in the master and fork workers from it
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+# Tells app.py to leave starting background threads to post_fork
+os.environ['APP_PRELOADED'] = '1' if preload_app else '0'
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the garbage collector's reach, so
+    # collections in the workers do not write to (and un-share) those pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import bl
+        bl.start_background_refresh()
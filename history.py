@@ -0,0 +1,225 @@
+# history.py
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = os.getenv(
+    'HISTORY_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history')
+)
+
+# IMD reports in Indian Standard Time, so days are bucketed in IST
+IST = timezone(timedelta(hours=5, minutes=30))
+
+FIELDS = ('max_temp', 'min_temp', 'max_departure', 'min_departure', 'humidity_morning', 'humidity_evening')
+# One fixed-size record per observation: timestamp followed by FIELDS
+_RECORD = struct.Struct('<d' + 'd' * len(FIELDS))
+
+
+def observation(weather_data):
+    """The FIELDS values of a scraper.get_station_data result, in order"""
+    temperature = weather_data.get('temperature', {})
+    humidity = weather_data.get('humidity', {})
+    return (
+        temperature.get('max', {}).get('value', 0.0),
+        temperature.get('min', {}).get('value', 0.0),
+        temperature.get('max', {}).get('departure', 0.0),
+        temperature.get('min', {}).get('departure', 0.0),
+        humidity.get('morning', 0.0),
+        humidity.get('evening', 0.0),
+    )
+
+
+def day_of(timestamp):
+    return datetime.fromtimestamp(timestamp, IST).date().isoformat()
+
+
+class _DailyAggregate:
+    """Running min/max/sum/count per field for one day"""
+    __slots__ = ('count', 'min', 'max', 'sum')
+
+    def __init__(self):
+        self.count = 0
+        self.min = [float('inf')] * len(FIELDS)
+        self.max = [float('-inf')] * len(FIELDS)
+        self.sum = [0.0] * len(FIELDS)
+
+    def add(self, values):
+        self.count += 1
+        for i, value in enumerate(values):
+            if value < self.min[i]:
+                self.min[i] = value
+            if value > self.max[i]:
+                self.max[i] = value
+            self.sum[i] += value
+
+    def to_dict(self, day):
+        return {
+            'date': day,
+            'observations': self.count,
+            **{
+                field: {
+                    'min': self.min[i],
+                    'max': self.max[i],
+                    'mean': round(self.sum[i] / self.count, 2)
+                }
+                for i, field in enumerate(FIELDS)
+            }
+        }
+
+
+class StationHistory:
+    """
+    Append-only observations for one station: a column per field backed
+    by array('d'), a per-day aggregate index, and the forecast issued on
+    each day. Persisted as a binary record file plus a JSON-lines
+    forecast file; both are re-read from their last offset when another
+    process has appended to them.
+    """
+
+    def __init__(self, station_id, directory=HISTORY_DIR):
+        self.station_id = station_id
+        self.records_path = os.path.join(directory, f'{station_id}.bin')
+        self.forecasts_path = os.path.join(directory, f'{station_id}.forecast.jsonl')
+        self.timestamps = array('d')
+        self.columns = {field: array('d') for field in FIELDS}
+        self.days = []
+        self.daily = {}
+        self.forecasts = {}
+        self._records_offset = 0
+        self._forecasts_offset = 0
+        self._lock = threading.Lock()
+
+    def _index(self, timestamp, values):
+        self.timestamps.append(timestamp)
+        for field, value in zip(FIELDS, values):
+            self.columns[field].append(value)
+        day = day_of(timestamp)
+        aggregate = self.daily.get(day)
+        if aggregate is None:
+            aggregate = self.daily[day] = _DailyAggregate()
+            self.days.append(day)
+        aggregate.add(values)
+
+    def sync(self):
+        """Pick up anything appended to the files since they were last read"""
+        with self._lock:
+            if os.path.exists(self.records_path) and os.path.getsize(self.records_path) > self._records_offset:
+                with open(self.records_path, 'rb') as file:
+                    file.seek(self._records_offset)
+                    data = file.read()
+                usable = len(data) - len(data) % _RECORD.size
+                for record in _RECORD.iter_unpack(data[:usable]):
+                    if not self.timestamps or record[0] >= self.timestamps[-1]:
+                        self._index(record[0], record[1:])
+                self._records_offset += usable
+
+            if os.path.exists(self.forecasts_path) and os.path.getsize(self.forecasts_path) > self._forecasts_offset:
+                with open(self.forecasts_path, 'rb') as file:
+                    file.seek(self._forecasts_offset)
+                    data = file.read()
+                complete = data[:data.rfind(b'\n') + 1]
+                for line in complete.splitlines():
+                    entry = json.loads(line)
+                    self.forecasts[entry['issued']] = entry['forecast']
+                self._forecasts_offset += len(complete)
+
+    def append(self, weather_data, timestamp=None):
+        """Record one successful fetch; unchanged repeats within a day are skipped"""
+        timestamp = timestamp or time.time()
+        values = observation(weather_data)
+        forecast = weather_data.get('forecast') or []
+        day = day_of(timestamp)
+        self.sync()
+        with self._lock:
+            if self.timestamps and timestamp < self.timestamps[-1]:
+                return False
+            if self.timestamps and day_of(self.timestamps[-1]) == day and \
+                    tuple(self.columns[field][-1] for field in FIELDS) == values:
+                return False
+
+            # Other processes may append too, so writes go to the end of the
+            # files and are indexed by the sync below rather than directly
+            os.makedirs(os.path.dirname(self.records_path), exist_ok=True)
+            with open(self.records_path, 'ab') as file:
+                file.write(_RECORD.pack(timestamp, *values))
+            if forecast and self.forecasts.get(day) != forecast:
+                line = json.dumps({'issued': day, 'forecast': forecast}, separators=(',', ':'))
+                with open(self.forecasts_path, 'ab') as file:
+                    file.write(line.encode('utf-8') + b'\n')
+        self.sync()
+        return True
+
+    def raw(self, start, end):
+        self.sync()
+        lo = bisect_left(self.timestamps, start)
+        hi = bisect_right(self.timestamps, end)
+        return [
+            {
+                'time': datetime.fromtimestamp(self.timestamps[i], IST).isoformat(),
+                **{field: self.columns[field][i] for field in FIELDS}
+            }
+            for i in range(lo, hi)
+        ]
+
+    def downsample(self, start, end, step):
+        """Mean of each field over consecutive `step`-second buckets"""
+        self.sync()
+        lo = bisect_left(self.timestamps, start)
+        hi = bisect_right(self.timestamps, end)
+        buckets = []
+        i = lo
+        while i < hi:
+            bucket_start = self.timestamps[i] - (self.timestamps[i] % step)
+            j = bisect_left(self.timestamps, bucket_start + step, i, hi)
+            count = j - i
+            buckets.append({
+                'time': datetime.fromtimestamp(bucket_start, IST).isoformat(),
+                'observations': count,
+                **{field: round(sum(self.columns[field][i:j]) / count, 2) for field in FIELDS}
+            })
+            i = j
+        return buckets
+
+    def daily_aggregates(self, start, end):
+        self.sync()
+        lo = bisect_left(self.days, day_of(start))
+        hi = bisect_right(self.days, day_of(end))
+        return [self.daily[day].to_dict(day) for day in self.days[lo:hi]]
+
+    def issued_forecasts(self, start, end):
+        self.sync()
+        first, last = day_of(start), day_of(end)
+        return [
+            {'issued': day, 'forecast': forecast}
+            for day, forecast in sorted(self.forecasts.items())
+            if first <= day <= last
+        ]
+
+
+_histories = {}
+_histories_lock = threading.Lock()
+
+
+def for_station(station_id):
+    with _histories_lock:
+        history = _histories.get(station_id)
+        if history is None:
+            history = _histories[station_id] = StationHistory(station_id)
+        return history
+
+
+def record(station_id, weather_data):
+    """Append a successful fetch to the station's history, never failing the caller"""
+    try:
+        for_station(station_id).append(weather_data)
+    except (OSError, ValueError) as e:
+        logger.error("Error recording history for station %s: %s", station_id, e)
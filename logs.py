@@ -0,0 +1,113 @@
+# logs.py
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+# Root log level (DEBUG, INFO, WARNING, ...)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# 'text' for human-readable lines, 'json' for one JSON object per line
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+# Fraction of DEBUG records kept; INFO and above are never sampled
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+_queue_handler = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and any traceback"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + '.%03dZ' % record.msecs,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Keeps roughly `rate` of DEBUG records and every record above DEBUG"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records without formatting them: the %-style message is built on
+    the listener thread, so the logging call itself only creates the record.
+    Arguments should not be mutated after they are logged.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure(level=LOG_LEVEL, format=LOG_FORMAT, debug_sample_rate=LOG_DEBUG_SAMPLE_RATE, stream=None):
+    """
+    Route all logging through a queue to a single writer thread. Safe to
+    call more than once; only the first call takes effect.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JSONFormatter() if format == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    records = queue.SimpleQueue()
+    _queue_handler = _DeferredQueueHandler(records)
+    if debug_sample_rate < 1:
+        _queue_handler.addFilter(DebugSampler(debug_sample_rate))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    # urllib3 logs every pooled request at DEBUG, which drowns out our own lines
+    logging.getLogger('urllib3').setLevel(max(root.level, logging.WARNING))
+
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+    os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def _restart_in_child():
+    """
+    A forked child (e.g. a gunicorn worker of a preloaded app) has no writer
+    thread. Give it its own queue and thread; records still queued at the
+    fork are left for the parent to write.
+    """
+    global _listener
+    if _listener is None:
+        return
+    records = queue.SimpleQueue()
+    _queue_handler.queue = records
+    _listener = logging.handlers.QueueListener(records, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown():
+    """Write out any queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
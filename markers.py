@@ -0,0 +1,153 @@
+# markers.py
+import re
+from array import array
+
+# Start of the marker array embedded in the nowcast page's JavaScript
+MARKERS_START = re.compile(r'var\s+(?:markers|points|locations)\s*=\s*(?=\[)')
+
+# One token per match, after any whitespace and comments:
+# 1 punctuation, 2 double-quoted string, 3 single-quoted string, 4 number, 5 identifier
+_TOKEN = re.compile(r"""
+    (?:\s|//[^\n]*|/\*.*?\*/)*
+    (?:
+        ([{}\[\]:,])
+      | "((?:[^"\\\n]|\\.)*)"
+      | '((?:[^'\\\n]|\\.)*)'
+      | ([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+      | ([A-Za-z_$][\w$]*)
+    )
+""", re.VERBOSE | re.DOTALL)
+_PUNCT, _DQ_STRING, _SQ_STRING, _NUMBER, _IDENT = range(1, 6)
+
+_ESCAPE = re.compile(r'\\(u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|\n|.)', re.DOTALL)
+_ESCAPES = {
+    'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0', '\n': '',
+}
+_LITERALS = {'true': True, 'false': False, 'null': None, 'undefined': None}
+
+
+def _unescape_char(match):
+    escaped = match.group(1)
+    if len(escaped) > 1:
+        return chr(int(escaped[1:], 16))
+    return _ESCAPES.get(escaped, escaped)
+
+
+class JSLiteralReader:
+    """
+    Reads JavaScript literals (objects with bare or quoted keys, arrays,
+    single- or double-quoted strings, numbers, true/false/null/undefined,
+    comments and trailing commas) directly from `text` starting at `pos`,
+    without rewriting the source into JSON first.
+    """
+
+    def __init__(self, text, pos=0):
+        self.text = text
+        self.pos = pos
+        # The scanner resumes each match where the previous one ended
+        self._match = _TOKEN.scanner(text, pos).match
+
+    def error(self, message):
+        return ValueError(f"{message} at position {self.pos}")
+
+    def token(self):
+        match = self._match()
+        if match is None:
+            raise self.error("Unexpected input")
+        self.pos = match.end()
+        kind = match.lastindex
+        if kind == _DQ_STRING or kind == _SQ_STRING:
+            value = match.group(kind)
+            return _DQ_STRING, _ESCAPE.sub(_unescape_char, value) if '\\' in value else value
+        return kind, match.group(kind)
+
+    def value(self, kind=None, token=None):
+        if kind is None:
+            kind, token = self.token()
+        if kind == _PUNCT:
+            if token == '{':
+                return self.object()
+            if token == '[':
+                return list(self._items())
+            raise self.error(f"Unexpected {token!r}")
+        if kind == _DQ_STRING:
+            return token
+        if kind == _NUMBER:
+            return float(token) if any(c in token for c in '.eE') else int(token)
+        if token in _LITERALS:
+            return _LITERALS[token]
+        raise self.error(f"Unsupported JavaScript value {token!r}")
+
+    def object(self):
+        # Opening brace already consumed
+        result = {}
+        while True:
+            kind, key = self.token()
+            if key == '}' and kind == _PUNCT:
+                return result
+            if kind == _PUNCT:
+                raise self.error("Expected object key")
+            kind, token = self.token()
+            if token != ':' or kind != _PUNCT:
+                raise self.error("Expected ':'")
+            result[key] = self.value()
+            kind, token = self.token()
+            if kind == _PUNCT and token == '}':
+                return result
+            if kind != _PUNCT or token != ',':
+                raise self.error("Expected ',' or '}'")
+
+    def _items(self):
+        # Opening bracket already consumed
+        while True:
+            kind, token = self.token()
+            if kind == _PUNCT and token == ']':
+                return
+            yield self.value(kind, token)
+            kind, token = self.token()
+            if kind == _PUNCT and token == ']':
+                return
+            if kind != _PUNCT or token != ',':
+                raise self.error("Expected ',' or ']'")
+
+    def iter_array(self):
+        """Yield the array's items one at a time as they are read"""
+        kind, token = self.token()
+        if kind != _PUNCT or token != '[':
+            raise self.error("Expected '['")
+        return self._items()
+
+
+def iter_marker_arrays(html_text):
+    """Yield a lazy iterator over the items of each embedded marker array, in page order"""
+    for match in MARKERS_START.finditer(html_text):
+        yield JSLiteralReader(html_text, match.end()).iter_array()
+
+
+class MarkerColumns:
+    """Alert markers stored as parallel arrays, one entry per marker"""
+
+    def __init__(self):
+        self.lat = array('d')
+        self.lng = array('d')
+        self.level = []
+        self.state = []
+        self.location = []
+
+    def append(self, alert):
+        coordinates = alert.get('coordinates') or {}
+        self.lat.append(coordinates.get('lat', 0.0))
+        self.lng.append(coordinates.get('lng', 0.0))
+        self.level.append(alert.get('alert_level', 'Unknown'))
+        self.state.append(alert.get('state', 'Unknown'))
+        self.location.append(alert.get('location', ''))
+
+    @classmethod
+    def from_alerts(cls, alerts):
+        columns = cls()
+        for alert in alerts:
+            columns.append(alert)
+        return columns
+
+    def __len__(self):
+        return len(self.level)
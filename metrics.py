@@ -0,0 +1,177 @@
+# metrics.py
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _key(labels):
+    # Label values are text in the exposition format; keeping them as str
+    # also keeps series sortable when callers mix ints (status codes) and strs
+    return tuple(map(str, labels))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        labels = _key(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_labels(self.labels, labels)} {value}' for labels, value in values]
+
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time by `collect() -> {labels tuple: value}`"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def set(self, value, *labels):
+        labels = _key(labels)
+        with self._lock:
+            self._values[labels] = value
+
+    def _samples(self):
+        if self.collect is not None:
+            values = sorted((_key(labels), value) for labels, value in self.collect().items())
+        else:
+            with self._lock:
+                values = sorted(self._values.items())
+        return [f'{self.name}{_labels(self.labels, labels)} {round(value, 3)}' for labels, value in values]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        labels = _key(labels)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket (not cumulative) counts, then count and sum
+                series = self._values[labels] = [0] * len(self.buckets) + [0, 0.0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def timed(self, *labels):
+        """Decorator observing how long each call of a function or coroutine function takes"""
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with _Timer(self, labels):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _Timer(self, labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((labels, list(series)) for labels, series in self._values.items())
+        lines = []
+        for labels, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket = _labels(self.labels, labels, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{bucket} {cumulative}')
+            bucket = _labels(self.labels, labels, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{bucket} {series[-2]}')
+            lines.append(f'{self.name}_count{_labels(self.labels, labels)} {series[-2]}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, labels)} {round(series[-1], 6)}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    return '\n'.join(metric.render() for metric in _registry) + '\n'
+
+
+upstream_seconds = Histogram(
+    'imd_upstream_request_seconds', 'Time waiting on IMD per request, including retries', ('page',)
+)
+upstream_responses = Counter(
+    'imd_upstream_responses_total',
+    'IMD responses by status code; "error" for network failures, "unavailable" when not attempted',
+    ('page', 'code')
+)
+parse_seconds = Histogram('imd_parse_seconds', 'Time parsing IMD pages', ('page',))
+stage_seconds = Histogram('imd_stage_seconds', 'Time spent in scraper and business logic functions', ('stage',))
+encode_seconds = Histogram(
+    'imd_response_encode_seconds', 'Time producing response bodies (encoding, compression or cache lookup)', ('route',)
+)
+cache_requests = Counter('imd_cache_requests_total', 'Cache lookups by result (hit, stale, miss)', ('cache', 'result'))
+rate_limited = Counter('imd_rate_limited_total', 'Requests rejected by the rate limiter', ('route',))
+snapshot_age = Gauge('imd_snapshot_age_seconds', 'Age of the cached data served per station and for alerts', ('kind', 'key'))
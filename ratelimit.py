@@ -0,0 +1,225 @@
+# ratelimit.py
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_DB = os.getenv(
+    'RATE_LIMIT_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ratelimits.db')
+)
+# Seconds between a worker's syncs with the shared counters; 0 writes every hit through
+RATE_LIMIT_SYNC_INTERVAL = float(os.getenv('RATE_LIMIT_SYNC_INTERVAL', 1))
+
+# Keys read or written per statement during a sync
+_BATCH = 500
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS counters_expires_at ON counters (expires_at);
+'''
+
+_UPSERT = '''
+INSERT INTO counters (key, count, expires_at) VALUES (?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    count = CASE WHEN counters.expires_at <= ? THEN excluded.count ELSE counters.count + excluded.count END,
+    expires_at = CASE WHEN counters.expires_at <= ? THEN excluded.expires_at ELSE counters.expires_at END
+'''
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    Rate limit counters in a SQLite file shared by every worker process on
+    the host, registered with `limits` as `sqlite://` (RATE_LIMIT_DB) or
+    `sqlite:///path/to/file.db`.
+
+    Hits are counted in memory and added to the shared counters in one
+    transaction every `sync_interval` seconds, which also reads back the
+    totals of the other workers. Between syncs a worker sees the shared
+    counts as of its last sync plus its own hits, so a limit can be
+    overshot by the hits other workers accept within one interval.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri=None, wrap_exceptions=False, sync_interval=RATE_LIMIT_SYNC_INTERVAL, **options):
+        path = urllib.parse.urlparse(uri).path if uri else ''
+        self.path = path or RATE_LIMIT_DB
+        self.sync_interval = float(sync_interval)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        # key -> [count, expires_at] as of the last sync
+        self._shared = {}
+        # key -> [hits since the last sync, expiry seconds]
+        self._pending = {}
+        self._synced_at = 0.0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connect(self):
+        # Caller holds self._lock. Reopened, and local counts dropped, after a fork
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+        self._pid = os.getpid()
+        self._shared.clear()
+        self._pending.clear()
+        return conn
+
+    def _read(self, conn, keys, now):
+        counts = {}
+        keys = list(keys)
+        for start in range(0, len(keys), _BATCH):
+            batch = keys[start:start + _BATCH]
+            rows = conn.execute(
+                f"SELECT key, count, expires_at FROM counters WHERE expires_at > ? AND key IN ({','.join('?' * len(batch))})",
+                [now, *batch]
+            )
+            counts.update((key, [count, expires_at]) for key, count, expires_at in rows)
+        return counts
+
+    def _sync(self, now):
+        """Flush local hits and refresh the shared counts of every key still in use"""
+        conn = self._connect()
+        # Keys that were zero at the last sync are re-read when next used
+        keys = {key for key, (count, _) in self._shared.items() if count} | set(self._pending)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(_UPSERT, [
+                (key, amount, now + expiry, now, now) for key, (amount, expiry) in self._pending.items()
+            ])
+            conn.execute('DELETE FROM counters WHERE expires_at <= ?', (now,))
+            shared = self._read(conn, keys, now)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._shared = shared
+        self._pending.clear()
+        self._synced_at = now
+
+    def _maybe_sync(self, now):
+        if now - self._synced_at < self.sync_interval:
+            return
+        try:
+            self._sync(now)
+        except sqlite3.Error as e:
+            # Keep counting locally and try again next interval
+            logger.error("Error syncing rate limit counters: %s", e)
+            self._synced_at = now
+
+    def _count(self, key, now):
+        """Shared count of `key` plus this worker's unsynced hits"""
+        shared = self._shared.get(key)
+        if shared is None:
+            try:
+                shared = self._read(self._connect(), [key], now).get(key, [0, math.inf])
+            except sqlite3.Error as e:
+                logger.error("Error reading rate limit counter %s: %s", key, e)
+                shared = [0, math.inf]
+            self._shared[key] = shared
+        count = shared[0] if shared[1] > now else 0
+        pending = self._pending.get(key)
+        return count + (pending[0] if pending else 0)
+
+    def _add(self, key, amount, expiry, now):
+        pending = self._pending.setdefault(key, [0, expiry])
+        pending[0] += amount
+        if self.sync_interval <= 0:
+            self._maybe_sync(now)
+
+    def incr(self, key, expiry, amount=1):
+        with self._lock:
+            now = time.time()
+            self._maybe_sync(now)
+            self._add(key, amount, expiry, now)
+            return self._count(key, now)
+
+    def get(self, key):
+        with self._lock:
+            now = time.time()
+            self._maybe_sync(now)
+            return self._count(key, now)
+
+    def get_expiry(self, key):
+        with self._lock:
+            now = time.time()
+            shared = self._shared.get(key)
+            if shared is not None and now < shared[1] < math.inf:
+                return shared[1]
+            pending = self._pending.get(key)
+            return now + pending[1] if pending else now
+
+    def check(self):
+        try:
+            with self._lock:
+                self._connect().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self._lock:
+            count = self._connect().execute('DELETE FROM counters').rowcount
+            self._shared.clear()
+            self._pending.clear()
+        return count
+
+    def clear(self, key):
+        with self._lock:
+            self._connect().execute('DELETE FROM counters WHERE key = ?', (key,))
+            self._shared.pop(key, None)
+            self._pending.pop(key, None)
+
+    def _window(self, key, expiry, now):
+        # Same weighting as limits' MemoryStorage
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count = self._count(previous_key, now)
+        current_count = self._count(current_key, now)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return current_key, (previous_count, previous_ttl, current_count, current_ttl)
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        with self._lock:
+            now = time.time()
+            self._maybe_sync(now)
+            current_key, (previous_count, previous_ttl, current_count, _) = self._window(key, expiry, now)
+            if math.floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+                return False
+            # Counters outlive their window so they can weigh the next one
+            self._add(current_key, amount, 2 * expiry, now)
+            return True
+
+    def get_sliding_window(self, key, expiry):
+        with self._lock:
+            now = time.time()
+            self._maybe_sync(now)
+            return self._window(key, expiry, now)[1]
+
+    def clear_sliding_window(self, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self.clear(previous_key)
+        self.clear(current_key)
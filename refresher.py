@@ -0,0 +1,137 @@
+# refresher.py
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class Refresher:
+    """
+    Periodically refreshes every key returned by `keys_fn` by calling
+    `refresh_fn(key)` on a bounded worker pool.
+
+    Keys requested most often recently are refreshed first in each cycle;
+    request counts are halved after every cycle so priorities follow
+    current traffic. Each refresh waits a random 0..`jitter` seconds before
+    it starts so upstream sees a trickle rather than a burst.
+    """
+
+    def __init__(self, keys_fn, refresh_fn, interval=600, workers=4, jitter=2.0, name='refresher'):
+        self.keys_fn = keys_fn
+        self.refresh_fn = refresh_fn
+        self.interval = interval
+        self.workers = workers
+        self.jitter = jitter
+        self.name = name
+        self._requests = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.cycle = 0
+        self.cycle_started = None
+        self.cycle_finished = None
+        self.cycle_total = 0
+        self.cycle_done = 0
+        self.lag = 0.0
+        self.stations = {}
+
+    def record_request(self, key):
+        with self._lock:
+            self._requests[key] += 1
+
+    def start(self):
+        # A thread started before a fork is not running in the child
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info("Started %s with interval %ss and %s workers", self.name, self.interval, self.workers)
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        now = time.time()
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'cycle': self.cycle,
+            'cycle_started': self.cycle_started,
+            'cycle_finished': self.cycle_finished,
+            'progress': {
+                'done': self.cycle_done,
+                'total': self.cycle_total
+            },
+            'lag': round(self.lag, 3),
+            'stations': {
+                str(key): {
+                    **state,
+                    'age': round(now - state['last_success'], 3) if state.get('last_success') else None
+                }
+                for key, state in list(self.stations.items())
+            }
+        }
+
+    def _prioritized_keys(self):
+        with self._lock:
+            counts = self._requests
+            # Decay so old bursts of traffic stop dominating the order
+            self._requests = Counter({key: count // 2 for key, count in counts.items() if count > 1})
+        keys = list(self.keys_fn())
+        keys.sort(key=lambda key: counts.get(key, 0), reverse=True)
+        return keys
+
+    def _refresh_one(self, key):
+        if self._stop.is_set():
+            return
+        if self.jitter:
+            time.sleep(random.uniform(0, self.jitter))
+        state = self.stations.setdefault(key, {'last_success': None, 'last_error': None})
+        state['last_attempt'] = time.time()
+        try:
+            result = self.refresh_fn(key)
+            if isinstance(result, dict) and 'error' in result:
+                state['last_error'] = result['error']
+            else:
+                state['last_success'] = time.time()
+                state['last_error'] = None
+        except Exception as e:
+            logger.error("Error refreshing %s: %s", key, e)
+            state['last_error'] = str(e)
+        finally:
+            with self._lock:
+                self.cycle_done += 1
+
+    def _run(self):
+        next_start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name) as pool:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                self.lag = max(0.0, now - next_start)
+                # Don't try to catch up on missed cycles, just start from now
+                next_start = max(next_start, now)
+                try:
+                    keys = self._prioritized_keys()
+                except Exception as e:
+                    logger.error("Error listing keys to refresh: %s", e)
+                    keys = []
+
+                self.cycle += 1
+                self.cycle_started = time.time()
+                self.cycle_total = len(keys)
+                self.cycle_done = 0
+                wait([pool.submit(self._refresh_one, key) for key in keys])
+                self.cycle_finished = time.time()
+                logger.debug("%s cycle %s refreshed %s keys", self.name, self.cycle, self.cycle_done)
+
+                next_start += self.interval
+                self._stop.wait(max(0.0, next_start - time.monotonic()))
@@ -1,152 +1,210 @@
 # scraper.py
 import requests
-from bs4 import BeautifulSoup
-import urllib3
+from bs4 import BeautifulSoup, SoupStrainer
+import upstream
+import markers
+import metrics
+import html
+import importlib.util
 import logging
+import os
 import re
 
-# Disable SSL warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def get_station_data(id):
+# Validators and parsed result of the last full response for each page,
+# so an unchanged page (304) is neither downloaded nor parsed again
+MAX_REMEMBERED_PAGES = 512
+_last_pages = {}
+
+def station_url(id):
+    return upstream.url(f'/responsive/stationWiseNowcastGIS.php?id={id}')
+
+def remembered_page(url):
+    """(etag, last_modified, parsed result) from the last full response for `url`"""
+    return _last_pages.get(url, (None, None, None))
+
+def remember_page(url, etag, last_modified, parsed):
+    if not (etag or last_modified):
+        return
+    if url not in _last_pages and len(_last_pages) >= MAX_REMEMBERED_PAGES:
+        _last_pages.pop(next(iter(_last_pages)))
+    _last_pages[url] = (etag, last_modified, parsed)
+
+def _fetch(url, page):
+    """Conditionally GET `url`; returns the response and, on a 304, the previously parsed result"""
+    etag, last_modified, parsed = remembered_page(url)
+    response = upstream.get(url, etag=etag, last_modified=last_modified, page=page)
+    if response.status_code == 304 and parsed is not None:
+        logger.debug("%s not modified, reusing parsed result", url)
+        return response, parsed
+    return response, None
+
+# Page labels read for each weather field, in the order they are looked up
+STATION_LABELS = (
+    ('max_temp', re.compile('Maximum Temperature', re.IGNORECASE)),
+    ('min_temp', re.compile('Minimum Temperature', re.IGNORECASE)),
+    ('max_dep', re.compile('Departure from Normal Max', re.IGNORECASE)),
+    ('min_dep', re.compile('Departure from Normal Min', re.IGNORECASE)),
+    ('rh_0830', re.compile('Relative Humidity.*0830', re.IGNORECASE)),
+    ('rh_1730', re.compile('Relative Humidity.*1730', re.IGNORECASE)),
+    ('sunrise', re.compile('Sunrise', re.IGNORECASE)),
+    ('sunset', re.compile('Sunset', re.IGNORECASE)),
+    ('moonrise', re.compile('Moonrise', re.IGNORECASE)),
+    ('moonset', re.compile('Moonset', re.IGNORECASE)),
+)
+FORECAST_DAYS = range(1, 8)
+
+# Cheap pre-filters so most text nodes are rejected with a single regex
+_ANY_LABEL = re.compile('|'.join(pattern.pattern for _, pattern in STATION_LABELS), re.IGNORECASE)
+_ANY_DAY = re.compile('Day [1-7]')
+
+# Prefer lxml when it is installed; HTML_PARSER overrides the choice
+_DEFAULT_PARSER = 'lxml' if importlib.util.find_spec('lxml') is not None else 'html.parser'
+HTML_PARSER = os.getenv('HTML_PARSER', _DEFAULT_PARSER)
+# Only build the tree for <table> elements; everything read lives in tables
+STATION_PARSE_TABLES_ONLY = os.getenv('STATION_PARSE_TABLES_ONLY', '1') == '1'
+
+def _safe_float(value, default=0.0):
+    try:
+        # Remove any non-numeric characters except decimal point and minus
+        cleaned = re.sub(r'[^0-9.-]', '', value)
+        return float(cleaned)
+    except (ValueError, TypeError):
+        return default
+
+def _label_value(text_node):
+    """Text of the cell after the cell holding `text_node`"""
     try:
-        URL = f'https://mausam.imd.gov.in/responsive/stationWiseNowcastGIS.php?id={id}'
-        logger.debug(f"Fetching data from URL: {URL}")
-
-        # Add headers to mimic a browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
+        next_cell = text_node.find_parent('td').find_next_sibling('td')
+        if next_cell:
+            return next_cell.text.strip()
+    except Exception as e:
+        logger.error("Error finding value for %s: %s", text_node.strip(), e)
+    return "0"
+
+def _forecast_row(text_node, day_number):
+    try:
+        date_row = text_node.find_parent('tr')
+        if date_row:
+            cells = date_row.find_all('td')
+            if len(cells) >= 4:
+                return {
+                    'day': day_number,
+                    'date': cells[0].text.strip(),
+                    'min': _safe_float(cells[1].text.strip()),
+                    'max': _safe_float(cells[2].text.strip()),
+                    'condition': cells[3].text.strip()
+                }
+    except Exception as e:
+        logger.error("Error getting forecast for day %s: %s", day_number, e)
+    return None
+
+def _extract_station_fields(soup):
+    """
+    Walk the document's text once, taking the first match for every label
+    and forecast day (the same node a per-label soup.find would return).
+    """
+    values = {}
+    pending_labels = list(STATION_LABELS)
+    forecast_rows = {}
+    pending_days = list(FORECAST_DAYS)
+
+    for text_node in soup.find_all(string=True):
+        if pending_labels and _ANY_LABEL.search(text_node):
+            for item in list(pending_labels):
+                name, pattern = item
+                if pattern.search(text_node):
+                    values[name] = _label_value(text_node)
+                    pending_labels.remove(item)
+        if pending_days and _ANY_DAY.search(text_node):
+            for day_number in list(pending_days):
+                if f"Day {day_number}" in text_node:
+                    forecast_rows[day_number] = _forecast_row(text_node, day_number)
+                    pending_days.remove(day_number)
+        if not pending_labels and not pending_days:
+            break
+
+    forecast = [forecast_rows[day] for day in FORECAST_DAYS if forecast_rows.get(day)]
+    return values, forecast
+
+@metrics.parse_seconds.timed('station')
+def parse_station_data(html_text):
+    """Extract weather data from a station page, or an error dict if it has no data table"""
+    parse_only = SoupStrainer('table') if STATION_PARSE_TABLES_ONLY else None
+    soup = BeautifulSoup(html_text, HTML_PARSER, parse_only=parse_only)
+    
+    # Find the main data table
+    table = soup.find('table', {'class': 'table'})
+    if not table:
+        logger.error("No table found in the response")
+        return {
+            'error': 'Weather data table not found',
+            'code': 500
         }
 
-        session = requests.Session()
-        response = session.get(URL, verify=False, headers=headers, timeout=30)
-        logger.debug(f"Response status code: {response.status_code}")
-        
-        if response.status_code != 200:
-            return {
-                'error': f'Server returned status code {response.status_code}',
-                'code': response.status_code
+    values, forecast = _extract_station_fields(soup)
+    if not forecast:
+        logger.warning("No forecast data found")
+
+    weather_data = {
+        'temperature': {
+            'max': {
+                'value': _safe_float(values.get('max_temp', "0")),
+                'departure': _safe_float(values.get('max_dep', "0"))
+            },
+            'min': {
+                'value': _safe_float(values.get('min_temp', "0")),
+                'departure': _safe_float(values.get('min_dep', "0"))
             }
+        },
+        'humidity': {
+            'morning': _safe_float(values.get('rh_0830', "0")),
+            'evening': _safe_float(values.get('rh_1730', "0"))
+        },
+        'astronomical': {
+            'sunrise': values.get('sunrise', "0"),
+            'sunset': values.get('sunset', "0"),
+            'moonrise': values.get('moonrise', "0"),
+            'moonset': values.get('moonset', "0")
+        },
+        'forecast': forecast
+    }
 
-        html_text = response.text
-        logger.debug(f"Response length: {len(html_text)}")
+    logger.debug("Successfully extracted weather data: %s", weather_data)
+    return weather_data
 
-        # Log the first part of the response for debugging
-        logger.debug(f"Response preview: {html_text[:500]}")
+@metrics.stage_seconds.timed('scraper.get_station_data')
+def get_station_data(id):
+    try:
+        URL = station_url(id)
+        logger.debug("Fetching data from URL: %s", URL)
 
-        soup = BeautifulSoup(html_text, 'html.parser')
+        response, cached = _fetch(URL, 'station')
+        logger.debug("Response status code: %s", response.status_code)
+        if cached is not None:
+            return cached
         
-        # Find the main data table
-        table = soup.find('table', {'class': 'table'})
-        if not table:
-            logger.error("No table found in the response")
+        if response.status_code != 200:
             return {
-                'error': 'Weather data table not found',
-                'code': 500
+                'error': f'Server returned status code {response.status_code}',
+                'code': response.status_code
             }
 
-        # Extract data using more robust methods
-        def find_value_by_label(label_text):
-            try:
-                label_cell = soup.find(text=re.compile(label_text, re.IGNORECASE))
-                if label_cell:
-                    # Try to find the next cell with the value
-                    next_cell = label_cell.find_parent('td').find_next_sibling('td')
-                    if next_cell:
-                        return next_cell.text.strip()
-            except Exception as e:
-                logger.error(f"Error finding value for {label_text}: {str(e)}")
-            return "0"
-
-        def safe_float(value, default=0.0):
-            try:
-                # Remove any non-numeric characters except decimal point and minus
-                cleaned = re.sub(r'[^0-9.-]', '', value)
-                return float(cleaned)
-            except (ValueError, TypeError):
-                return default
-
-        # Extract temperature data
-        max_temp = find_value_by_label('Maximum Temperature')
-        min_temp = find_value_by_label('Minimum Temperature')
-        max_dep = find_value_by_label('Departure from Normal Max')
-        min_dep = find_value_by_label('Departure from Normal Min')
-        
-        # Extract humidity data
-        rh_0830 = find_value_by_label('Relative Humidity.*0830')
-        rh_1730 = find_value_by_label('Relative Humidity.*1730')
-
-        # Extract astronomical data
-        sunrise = find_value_by_label('Sunrise')
-        sunset = find_value_by_label('Sunset')
-        moonrise = find_value_by_label('Moonrise')
-        moonset = find_value_by_label('Moonset')
-
-        # Extract forecast data
-        def get_forecast_data(day_number):
-            try:
-                date_cell = soup.find(text=re.compile(f"Day {day_number}"))
-                if date_cell:
-                    date_row = date_cell.find_parent('tr')
-                    if date_row:
-                        cells = date_row.find_all('td')
-                        if len(cells) >= 4:
-                            return {
-                                'day': day_number,
-                                'date': cells[0].text.strip(),
-                                'min': safe_float(cells[1].text.strip()),
-                                'max': safe_float(cells[2].text.strip()),
-                                'condition': cells[3].text.strip()
-                            }
-            except Exception as e:
-                logger.error(f"Error getting forecast for day {day_number}: {str(e)}")
-            return None
-
-        # Get forecast for 7 days
-        forecast = []
-        for day in range(1, 8):
-            day_forecast = get_forecast_data(day)
-            if day_forecast:
-                forecast.append(day_forecast)
-
-        if not forecast:
-            logger.warning("No forecast data found")
-
-        weather_data = {
-            'temperature': {
-                'max': {
-                    'value': safe_float(max_temp),
-                    'departure': safe_float(max_dep)
-                },
-                'min': {
-                    'value': safe_float(min_temp),
-                    'departure': safe_float(min_dep)
-                }
-            },
-            'humidity': {
-                'morning': safe_float(rh_0830),
-                'evening': safe_float(rh_1730)
-            },
-            'astronomical': {
-                'sunrise': sunrise,
-                'sunset': sunset,
-                'moonrise': moonrise,
-                'moonset': moonset
-            },
-            'forecast': forecast
-        }
+        html_text = response.text
+        logger.debug("Response length: %s", len(html_text))
 
-        logger.debug(f"Successfully extracted weather data: {weather_data}")
+        weather_data = parse_station_data(html_text)
+        if 'error' not in weather_data:
+            remember_page(URL, *upstream.validators(response), weather_data)
         return weather_data
 
+    except upstream.UpstreamUnavailable as e:
+        logger.warning("Not fetching from IMD: %s", e)
+        return {
+            'error': str(e),
+            'code': 503
+        }
     except requests.Timeout:
         logger.error("Request timed out")
         return {
@@ -154,20 +212,17 @@ def get_station_data(id):
             'code': 504
         }
     except requests.RequestException as e:
-        logger.error(f"Request error: {str(e)}")
+        logger.error("Request error: %s", e)
         return {
             'error': f'Network error: {str(e)}',
             'code': 500
         }
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
+        logger.error("Unexpected error: %s", e)
         return {
             'error': f'Unexpected error: {str(e)}',
             'code': 500
         }
-    
-    logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
 
 def parse_alert_level(color_class):
     """Convert color class to alert level"""
@@ -184,20 +239,110 @@ def parse_alert_level(color_class):
             return color_map[key]
     return 'Unknown'
 
-def get_alerts():
-    try:
-        URL = 'https://mausam.imd.gov.in/responsive/stationWiseNowcastGIS.php'
-        logger.debug(f"Fetching alerts from URL: {URL}")
+# "Last Updated ..." text of a <div> with no child elements
+_UPDATE_TIME = re.compile(r'<div\b[^>]*>([^<]*Last Updated[^<]*)</div>', re.IGNORECASE)
 
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5'
+def parse_update_time(html_text):
+    match = _UPDATE_TIME.search(html_text)
+    if match:
+        return html.unescape(match.group(1)).strip()
+    return None
+
+def marker_to_alert(marker):
+    return {
+        'location': marker.get('location', '').strip(),
+        'state': marker.get('state', '').strip(),
+        'alert_level': marker.get('alertLevel', 'Unknown'),
+        'warning_type': marker.get('warningType', '').strip(),
+        'details': marker.get('description', '').strip(),
+        'valid_time': marker.get('validTime', '').strip(),
+        'coordinates': {
+            'lat': float(marker.get('lat', 0)),
+            'lng': float(marker.get('lng', 0))
         }
+    }
 
-        session = requests.Session()
-        response = session.get(URL, verify=False, headers=headers, timeout=30)
-        logger.debug(f"Response status code: {response.status_code}")
+def iter_marker_alerts(marker_array):
+    """Yield alert records as each marker in `marker_array` is decoded"""
+    for marker in marker_array:
+        alert = marker_to_alert(marker)
+        # Only add if we have a valid location
+        if alert['location']:
+            yield alert
+
+def parse_marker_alerts(html_text):
+    """Alerts from the first marker array on the page that decodes cleanly"""
+    for marker_array in markers.iter_marker_arrays(html_text):
+        try:
+            return list(iter_marker_alerts(marker_array))
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.error("Error parsing map data: %s", e)
+    return []
+
+def alerts_url():
+    return upstream.url('/responsive/stationWiseNowcastGIS.php')
+
+@metrics.parse_seconds.timed('alerts')
+def parse_alerts_page(html_text):
+    """Alerts from the nowcast page's marker data, or its alert table if there are no markers"""
+    update_time = parse_update_time(html_text)
+    alerts = parse_marker_alerts(html_text)
+
+    # If no alerts found in map data, try parsing the table
+    if not alerts:
+        soup = BeautifulSoup(html_text, HTML_PARSER)
+        alert_table = soup.find('table', {'class': ['table', 'alert-table']})
+        if alert_table:
+            rows = alert_table.find_all('tr')
+            for row in rows[1:]:  # Skip header row
+                cols = row.find_all('td')
+                if len(cols) >= 3:
+                    alert_color = ''
+                    # Try to get color from cell background or class
+                    for col in cols:
+                        background_color = col.get('style', '')
+                        if 'background' in background_color.lower():
+                            alert_color = background_color
+                            break
+                    
+                    alert = {
+                        'location': cols[0].text.strip(),
+                        'alert_level': parse_alert_level(alert_color),
+                        'warning_type': cols[1].text.strip(),
+                        'details': cols[2].text.strip(),
+                        'valid_time': cols[3].text.strip() if len(cols) > 3 else None
+                    }
+                    alerts.append(alert)
+
+    # Group alerts by state
+    alerts_by_state = {}
+    for alert in alerts:
+        state = alert.get('state', 'Unknown')
+        if state not in alerts_by_state:
+            alerts_by_state[state] = []
+        alerts_by_state[state].append(alert)
+
+    result = {
+        'last_updated': update_time,
+        'alerts': alerts,
+        'alerts_by_state': alerts_by_state,
+        'total_alerts': len(alerts),
+        'states_affected': len(alerts_by_state)
+    }
+
+    logger.debug("Successfully extracted %s alerts from %s states", len(alerts), len(alerts_by_state))
+    return result
+
+@metrics.stage_seconds.timed('scraper.get_alerts')
+def get_alerts():
+    try:
+        URL = alerts_url()
+        logger.debug("Fetching alerts from URL: %s", URL)
+
+        response, cached = _fetch(URL, 'alerts')
+        logger.debug("Response status code: %s", response.status_code)
+        if cached is not None:
+            return cached
 
         if response.status_code != 200:
             return {
@@ -205,110 +350,16 @@ def get_alerts():
                 'code': response.status_code
             }
 
-        html_text = response.text
-        soup = BeautifulSoup(html_text, 'html.parser')
-
-        # Find the update time
-        update_time = None
-        time_div = soup.find('div', string=re.compile(r'Last Updated.*'))
-        if time_div:
-            update_time = time_div.text.strip()
-
-        # Extract map data
-        alerts = []
-        script_tags = soup.find_all('script')
-        for script in script_tags:
-            if not script.string:
-                continue
-            
-            # Look for marker data in different possible formats
-            for pattern in [
-                r'var\s+markers\s*=\s*(\[.*?\]);',
-                r'var\s+points\s*=\s*(\[.*?\]);',
-                r'var\s+locations\s*=\s*(\[.*?\]);'
-            ]:
-                markers_match = re.search(pattern, script.string, re.DOTALL)
-                if markers_match:
-                    try:
-                        # Clean up the JavaScript array to make it valid JSON
-                        markers_str = markers_match.group(1)
-                        # Quote all keys
-                        markers_str = re.sub(r'(\w+):', r'"\1":', markers_str)
-                        # Replace single quotes with double quotes
-                        markers_str = re.sub(r'\'', '"', markers_str)
-                        # Handle any special characters in text
-                        markers_str = markers_str.replace('\n', '\\n').replace('\r', '\\r')
-                        
-                        map_data = json.loads(markers_str)
-                        
-                        for marker in map_data:
-                            alert = {
-                                'location': marker.get('location', '').strip(),
-                                'state': marker.get('state', '').strip(),
-                                'alert_level': marker.get('alertLevel', 'Unknown'),
-                                'warning_type': marker.get('warningType', '').strip(),
-                                'details': marker.get('description', '').strip(),
-                                'valid_time': marker.get('validTime', '').strip(),
-                                'coordinates': {
-                                    'lat': float(marker.get('lat', 0)),
-                                    'lng': float(marker.get('lng', 0))
-                                }
-                            }
-                            
-                            # Only add if we have a valid location
-                            if alert['location']:
-                                alerts.append(alert)
-                        
-                        break  # Break if we successfully parsed the data
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Error parsing map data: {e}")
-                    except Exception as e:
-                        logger.error(f"Error processing marker data: {e}")
-
-        # If no alerts found in map data, try parsing the table
-        if not alerts:
-            alert_table = soup.find('table', {'class': ['table', 'alert-table']})
-            if alert_table:
-                rows = alert_table.find_all('tr')
-                for row in rows[1:]:  # Skip header row
-                    cols = row.find_all('td')
-                    if len(cols) >= 3:
-                        alert_color = ''
-                        # Try to get color from cell background or class
-                        for col in cols:
-                            background_color = col.get('style', '')
-                            if 'background' in background_color.lower():
-                                alert_color = background_color
-                                break
-                        
-                        alert = {
-                            'location': cols[0].text.strip(),
-                            'alert_level': parse_alert_level(alert_color),
-                            'warning_type': cols[1].text.strip(),
-                            'details': cols[2].text.strip(),
-                            'valid_time': cols[3].text.strip() if len(cols) > 3 else None
-                        }
-                        alerts.append(alert)
-
-        # Group alerts by state
-        alerts_by_state = {}
-        for alert in alerts:
-            state = alert.get('state', 'Unknown')
-            if state not in alerts_by_state:
-                alerts_by_state[state] = []
-            alerts_by_state[state].append(alert)
-
-        result = {
-            'last_updated': update_time,
-            'alerts': alerts,
-            'alerts_by_state': alerts_by_state,
-            'total_alerts': len(alerts),
-            'states_affected': len(alerts_by_state)
-        }
-
-        logger.debug(f"Successfully extracted {len(alerts)} alerts from {len(alerts_by_state)} states")
+        result = parse_alerts_page(response.text)
+        remember_page(URL, *upstream.validators(response), result)
         return result
 
+    except upstream.UpstreamUnavailable as e:
+        logger.warning("Not fetching from IMD: %s", e)
+        return {
+            'error': str(e),
+            'code': 503
+        }
     except requests.Timeout:
         logger.error("Request timed out")
         return {
@@ -316,13 +367,13 @@ def get_alerts():
             'code': 504
         }
     except requests.RequestException as e:
-        logger.error(f"Request error: {str(e)}")
+        logger.error("Request error: %s", e)
         return {
             'error': f'Network error: {str(e)}',
             'code': 500
         }
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
+        logger.error("Unexpected error: %s", e)
         return {
             'error': f'Unexpected error: {str(e)}',
             'code': 500
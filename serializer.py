@@ -0,0 +1,176 @@
+# serializer.py
+import gzip
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from werkzeug.http import http_date, parse_accept_header, parse_date, parse_etags, quote_etag
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# JSON encoder used for response bodies: 'orjson' (if installed) or 'json'
+JSON_SERIALIZER = os.getenv('JSON_SERIALIZER', 'orjson' if orjson else 'json')
+# Bodies smaller than this many bytes are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+# Number of response versions whose encoded bodies are kept
+ENCODED_CACHE_SIZE = int(os.getenv('ENCODED_CACHE_SIZE', 256))
+
+
+def _dumps_json(payload):
+    # Same compact, key-sorted output as Flask's jsonify
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def _dumps_orjson(payload):
+    return orjson.dumps(
+        payload,
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+    )
+
+
+SERIALIZERS = {'json': _dumps_json}
+if orjson is not None:
+    SERIALIZERS['orjson'] = _dumps_orjson
+
+if JSON_SERIALIZER not in SERIALIZERS:
+    logger.warning("JSON serializer %r is not available, using json", JSON_SERIALIZER)
+    JSON_SERIALIZER = 'json'
+
+dumps = SERIALIZERS[JSON_SERIALIZER]
+
+
+def _gzip(body):
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _brotli(body):
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+COMPRESSORS = {'gzip': _gzip}
+if brotli is not None:
+    COMPRESSORS['br'] = _brotli
+
+# Content-Encodings offered to clients, most preferred first
+ENCODINGS = tuple(encoding for encoding in ('br', 'gzip') if encoding in COMPRESSORS)
+
+
+def negotiate(accept_encoding):
+    """The encoding to use for an Accept-Encoding header value, or None for identity"""
+    if not accept_encoding:
+        return None
+    return parse_accept_header(accept_encoding).best_match(ENCODINGS)
+
+
+class EncodedCache:
+    """
+    Encoded response bodies keyed by route and version string (the
+    response's ETag), so each version of a document is serialized once and
+    each compressed variant is built once, on first request. The route is
+    part of the key because routes of different shape may share an ETag.
+    """
+
+    def __init__(self, max_size=ENCODED_CACHE_SIZE, min_size=COMPRESS_MIN_SIZE):
+        self.max_size = max_size
+        self.min_size = min_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _variants(self, key):
+        with self._lock:
+            variants = self._entries.get(key)
+            if variants is None:
+                variants = self._entries[key] = {}
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            return variants
+
+    def get(self, key, payload, encoding=None):
+        """
+        Return (body, encoding) for `payload` (an object, or JSON bytes that
+        are already encoded); a `key` of None encodes without caching. The
+        returned encoding is None when the body is sent as-is because it is
+        below the size threshold or no encoding was asked for.
+        """
+        variants = self._variants(key) if key is not None else {}
+        body = variants.get(None)
+        if body is None:
+            body = variants[None] = payload if isinstance(payload, bytes) else dumps(payload)
+        if encoding is None or len(body) < self.min_size:
+            return body, None
+
+        # Concurrent first requests may both compress; the results are identical
+        compressed = variants.get(encoding)
+        if compressed is None:
+            compressed = variants[encoding] = COMPRESSORS[encoding](body)
+        return compressed, encoding
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+encoded_cache = EncodedCache()
+
+
+def respond(validators, payload, headers, route=None):
+    """
+    (status, body, response headers) for sending `payload` (an object, or
+    JSON bytes already encoded) in reply to a request with `headers`.
+
+    The body is compressed per Accept-Encoding. ETag, Last-Modified and
+    Cache-Control come from `validators` (as returned by the
+    bl.get_*_validators functions; None sends an uncached response). A
+    request carrying a matching ETag or an If-Modified-Since no older than
+    Last-Modified gets a 304 before anything is encoded. Encoded bodies are
+    cached per `route` (the matched route's path template) and ETag.
+    """
+    encoding = negotiate(headers.get('Accept-Encoding'))
+    response_headers = {'Vary': 'Accept-Encoding'}
+    if validators is None:
+        body, encoding = encoded_cache.get(None, payload, encoding)
+        if encoding:
+            response_headers['Content-Encoding'] = encoding
+        return 200, body, response_headers
+    etag, last_modified, max_age = validators
+
+    # Each encoding is a different representation, so it gets its own ETag
+    if_none_match = parse_etags(headers.get('If-None-Match'))
+    tags = (etag, f'{etag}-{encoding}') if encoding else (etag,)
+    matched = next((tag for tag in tags if tag in if_none_match), None)
+    if_modified_since = parse_date(headers.get('If-Modified-Since'))
+    if matched:
+        status, body, etag = 304, b'', matched
+    elif not if_none_match and if_modified_since and last_modified and \
+            int(last_modified) <= if_modified_since.timestamp():
+        # Either ETag form matches a later If-None-Match, so nothing is encoded to pick one
+        status, body, etag = 304, b'', tags[-1]
+    else:
+        status = 200
+        body, encoding = encoded_cache.get((route, etag), payload, encoding)
+        if encoding:
+            etag = f'{etag}-{encoding}'
+            response_headers['Content-Encoding'] = encoding
+
+    response_headers['ETag'] = quote_etag(etag)
+    if last_modified:
+        response_headers['Last-Modified'] = http_date(int(last_modified))
+    response_headers['Cache-Control'] = f'public, max-age={int(max_age)}'
+    return status, body, response_headers
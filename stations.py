@@ -0,0 +1,117 @@
+# stations.py
+import json
+import logging
+import os
+import threading
+import time
+
+import serializer
+from geo import GeoIndex
+
+logger = logging.getLogger(__name__)
+
+STATIONS_FILE = os.getenv(
+    'STATIONS_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stations.json')
+)
+# How often (seconds) to stat stations.json for changes
+STATIONS_CHECK_INTERVAL = float(os.getenv('STATIONS_CHECK_INTERVAL', 5))
+
+
+class StationIndex:
+    """Immutable view of stations.json, keyed by stationId with secondary indexes"""
+
+    def __init__(self, stations, mtime):
+        self.mtime = mtime
+        self.by_id = {}
+        self.by_region = {}
+        self.by_jurisdiction = {}
+
+        for station in stations:
+            station_id = station['stationId']
+            if station_id in self.by_id:
+                logger.warning("Duplicate station ID %s in stations file, keeping first entry", station_id)
+                continue
+            self.by_id[station_id] = station
+            self.by_region.setdefault(station.get('region', '').lower(), []).append(station)
+            self.by_jurisdiction.setdefault(station.get('jurisdiction', '').lower(), []).append(station)
+
+        self.stations = list(self.by_id.values())
+        # Stations without lat/lng are left out of the spatial index
+        self.geo = GeoIndex(
+            [station.get('lat', float('nan')) for station in self.stations],
+            [station.get('lng', float('nan')) for station in self.stations]
+        )
+        # Pre-serialized /station/all body, matching Flask's compact sorted output
+        self.all_json = serializer.dumps({'code': 200, 'result': self.stations})
+
+
+_index = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+
+def load():
+    """(Re)load stations.json and swap in a new index"""
+    global _index, _last_check
+    with _lock:
+        mtime = os.path.getmtime(STATIONS_FILE)
+        with open(STATIONS_FILE, 'r') as file:
+            file_data = json.load(file)
+        _index = StationIndex(file_data, mtime)
+        _last_check = time.monotonic()
+        logger.info("Loaded %s stations from %s", len(_index.stations), STATIONS_FILE)
+        return _index
+
+
+def is_loaded():
+    """True once the registry has been read; does not trigger a load"""
+    return _index is not None
+
+
+def get_index():
+    """Return the current index, reloading it if stations.json has changed"""
+    global _last_check
+    index = _index
+    if index is None:
+        return load()
+
+    now = time.monotonic()
+    if now - _last_check < STATIONS_CHECK_INTERVAL:
+        return index
+
+    _last_check = now
+    try:
+        if os.path.getmtime(STATIONS_FILE) != index.mtime:
+            return load()
+    except (OSError, ValueError) as e:
+        # Keep serving the last good index if the file is mid-write or gone
+        logger.error("Error reloading stations file: %s", e)
+    return index
+
+
+def get(station_id):
+    return get_index().by_id.get(station_id)
+
+
+def get_all():
+    return get_index().stations
+
+
+def get_all_json():
+    return get_index().all_json
+
+
+def get_by_region(region):
+    return get_index().by_region.get(region.lower(), [])
+
+
+def get_by_jurisdiction(jurisdiction):
+    return get_index().by_jurisdiction.get(jurisdiction.lower(), [])
+
+
+def nearest(lat, lng, count):
+    """The `count` stations with coordinates nearest to lat/lng, as (station, distance_km) pairs"""
+    index = get_index()
+    positions, distances = index.geo.nearest(lat, lng, count)
+    return [(index.stations[position], float(distance)) for position, distance in zip(positions, distances)]
@@ -0,0 +1,313 @@
+# store.py
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DB = os.getenv(
+    'SNAPSHOT_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots.db')
+)
+# Size bounds enforced by compaction
+SNAPSHOT_DB_MAX_ROWS = int(os.getenv('SNAPSHOT_DB_MAX_ROWS', 1000))
+SNAPSHOT_DB_MAX_BYTES = int(os.getenv('SNAPSHOT_DB_MAX_BYTES', 50 * 1024 * 1024))
+# Seconds a process may hold the right to refresh a key before others may take over
+SNAPSHOT_LEASE_TTL = int(os.getenv('SNAPSHOT_LEASE_TTL', 60))
+# Seconds a request waits for another process's first fetch of a key
+SNAPSHOT_LEASE_WAIT = float(os.getenv('SNAPSHOT_LEASE_WAIT', 10))
+# Compact after this many writes
+SNAPSHOT_COMPACT_EVERY = int(os.getenv('SNAPSHOT_COMPACT_EVERY', 200))
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS snapshots (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_fetched_at ON snapshots (fetched_at);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+'''
+
+
+def _pending():
+    """Result for a key another process is still fetching for the first time"""
+    return {
+        'error': 'Data is being fetched by another process, try again shortly',
+        'code': 503
+    }, None
+
+
+class SnapshotStore:
+    """
+    Latest parsed snapshots (station weather, alerts) in a SQLite file
+    shared by every worker process on the host.
+
+    Each key holds one JSON value and the time it was fetched. Leases let
+    one process at a time refresh a key while the others keep serving
+    the stored value.
+    """
+
+    def __init__(self, path=SNAPSHOT_DB, max_rows=SNAPSHOT_DB_MAX_ROWS, max_bytes=SNAPSHOT_DB_MAX_BYTES,
+                 lease_ttl=SNAPSHOT_LEASE_TTL, lease_wait=SNAPSHOT_LEASE_WAIT, compact_every=SNAPSHOT_COMPACT_EVERY):
+        self.path = path
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.lease_ttl = lease_ttl
+        self.lease_wait = lease_wait
+        self.compact_every = compact_every
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._owner = None
+
+    @property
+    def owner(self):
+        """Lease owner id of this process, new after a fork so workers do not share leases"""
+        pid = os.getpid()
+        owner = self._owner
+        if owner is None or owner[0] != pid:
+            with self._lock:
+                if self._owner is None or self._owner[0] != pid:
+                    self._owner = (pid, uuid.uuid4().hex)
+                owner = self._owner
+        return owner[1]
+
+    def _connect(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.executescript(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Return (value, fetched_at) for `key`, or None if nothing is stored"""
+        row = self._connect().execute(
+            'SELECT value, fetched_at FROM snapshots WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def latest(self, prefix, limit):
+        """{key: (value, fetched_at)} for the `limit` most recently fetched keys starting with `prefix`"""
+        rows = self._connect().execute(
+            'SELECT key, value, fetched_at FROM snapshots WHERE key >= ? AND key < ? ORDER BY fetched_at DESC LIMIT ?',
+            (prefix, prefix + '\uffff', limit)
+        )
+        return {key: (json.loads(value), fetched_at) for key, value, fetched_at in rows}
+
+    def put(self, key, value, fetched_at=None):
+        encoded = json.dumps(value, separators=(',', ':'))
+        try:
+            self._connect().execute(
+                'INSERT OR REPLACE INTO snapshots (key, value, fetched_at, size) VALUES (?, ?, ?, ?)',
+                (key, encoded, fetched_at or time.time(), len(encoded))
+            )
+        except sqlite3.Error as e:
+            logger.error("Error writing %s to snapshot store: %s", key, e)
+            return
+        with self._lock:
+            self._writes += 1
+            compact = self._writes % self.compact_every == 0
+        if compact:
+            self.compact()
+
+    def acquire(self, key):
+        """Try to become the one process refreshing `key`; returns True on success"""
+        now = time.time()
+        cursor = self._connect().execute(
+            '''INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?)
+               ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+               WHERE leases.expires_at < ? OR leases.owner = excluded.owner''',
+            (key, self.owner, now + self.lease_ttl, now)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, key):
+        try:
+            self._connect().execute(
+                'DELETE FROM leases WHERE key = ? AND owner = ?', (key, self.owner)
+            )
+        except sqlite3.Error as e:
+            logger.error("Error releasing lease on %s: %s", key, e)
+
+    def compact(self):
+        """Drop expired leases and the oldest snapshots beyond the row and size bounds"""
+        try:
+            conn = self._connect()
+            conn.execute('DELETE FROM leases WHERE expires_at < ?', (time.time(),))
+            conn.execute(
+                '''DELETE FROM snapshots WHERE key IN (
+                       SELECT key FROM snapshots ORDER BY fetched_at DESC LIMIT -1 OFFSET ?
+                   )''',
+                (self.max_rows,)
+            )
+            # Keep the newest rows whose running total size fits the byte bound
+            conn.execute(
+                '''DELETE FROM snapshots WHERE key IN (
+                       SELECT key FROM (
+                           SELECT key, SUM(size) OVER (ORDER BY fetched_at DESC) AS total FROM snapshots
+                       ) WHERE total > ?
+                   )''',
+                (self.max_bytes,)
+            )
+            conn.execute('PRAGMA incremental_vacuum')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        except sqlite3.Error as e:
+            logger.error("Error compacting snapshot store: %s", e)
+
+    def load_through(self, key, max_age, fetch, is_error):
+        """
+        Return the stored value for `key` if it is younger than `max_age`,
+        otherwise refresh it with `fetch()` if no other process is doing so.
+        With nothing stored yet, waits up to `lease_wait` seconds for the
+        process that is, then gives up with a 503 error result.
+        Returns (value, fetched_at); fetched_at is None for error results.
+        """
+        stored = self.get(key)
+        if stored is not None and time.time() - stored[1] < max_age:
+            return stored
+
+        if not self.acquire(key):
+            if stored is not None:
+                logger.debug("%s is being refreshed by another process, serving stored value", key)
+                return stored
+            # First fetch anywhere is already running elsewhere; wait briefly for it
+            deadline = time.monotonic() + self.lease_wait
+            while time.monotonic() < deadline:
+                time.sleep(0.25)
+                stored = self.get(key)
+                if stored is not None:
+                    return stored
+                if self.acquire(key):
+                    break
+            else:
+                logger.warning("Gave up waiting for another process to fetch %s", key)
+                return _pending()
+
+        try:
+            value = fetch()
+            if is_error(value):
+                return stored if stored is not None else (value, None)
+            fetched_at = time.time()
+            self.put(key, value, fetched_at)
+            return value, fetched_at
+        finally:
+            self.release(key)
+
+    async def aload_through(self, key, max_age, fetch, is_error):
+        """load_through for an event loop: `fetch` is a coroutine function and waits don't block"""
+        stored = self.get(key)
+        if stored is not None and time.time() - stored[1] < max_age:
+            return stored
+
+        if not self.acquire(key):
+            if stored is not None:
+                logger.debug("%s is being refreshed by another process, serving stored value", key)
+                return stored
+            deadline = time.monotonic() + self.lease_wait
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.25)
+                stored = self.get(key)
+                if stored is not None:
+                    return stored
+                if self.acquire(key):
+                    break
+            else:
+                logger.warning("Gave up waiting for another process to fetch %s", key)
+                return _pending()
+
+        try:
+            value = await fetch()
+            if is_error(value):
+                return stored if stored is not None else (value, None)
+            fetched_at = time.time()
+            self.put(key, value, fetched_at)
+            return value, fetched_at
+        finally:
+            self.release(key)
+
+    def load_many_through(self, keys, max_age_for, bulk_fetch, is_error):
+        """
+        Bulk form of load_through: `keys` maps each store key to the caller's
+        own ID, and `bulk_fetch(ids) -> {id: value}` fetches the stale keys
+        this process holds the lease on. Keys another process is fetching
+        for the first time are waited for as in load_through.
+        Returns {id: (value, fetched_at)}.
+        """
+        deadline = time.monotonic() + self.lease_wait
+        results = {}
+        stored_values = {}
+        to_fetch = {}
+        pending = {}
+        now = time.time()
+        for key, id in keys.items():
+            stored = self.get(key)
+            if stored is not None and now - stored[1] < max_age_for(id):
+                results[id] = stored
+            elif self.acquire(key):
+                to_fetch[id] = key
+                stored_values[id] = stored
+            elif stored is not None:
+                results[id] = stored
+            else:
+                pending[id] = key
+
+        if to_fetch:
+            results.update(self._fetch_many(to_fetch, stored_values, bulk_fetch, is_error))
+
+        while pending:
+            if time.monotonic() >= deadline:
+                logger.warning("Gave up waiting for another process to fetch %s", ', '.join(pending.values()))
+                results.update((id, _pending()) for id in pending)
+                break
+            time.sleep(0.25)
+            to_fetch = {}
+            for id, key in list(pending.items()):
+                stored = self.get(key)
+                if stored is not None:
+                    results[id] = stored
+                elif self.acquire(key):
+                    to_fetch[id] = key
+                else:
+                    continue
+                del pending[id]
+            if to_fetch:
+                results.update(self._fetch_many(to_fetch, {}, bulk_fetch, is_error))
+        return results
+
+    def _fetch_many(self, to_fetch, stored_values, bulk_fetch, is_error):
+        """Fetch and store the keys in `to_fetch` ({id: key}), whose leases are held, then release them"""
+        results = {}
+        try:
+            fetched = bulk_fetch(list(to_fetch))
+            fetched_at = time.time()
+            for id, value in fetched.items():
+                if is_error(value):
+                    stored = stored_values.get(id)
+                    results[id] = stored if stored is not None else (value, None)
+                else:
+                    self.put(to_fetch[id], value, fetched_at)
+                    results[id] = (value, fetched_at)
+            return results
+        finally:
+            for key in to_fetch.values():
+                self.release(key)
@@ -0,0 +1,178 @@
+# stream.py
+import asyncio
+import logging
+import os
+import queue
+import threading
+
+from serializer import dumps
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for a new alerts snapshot while anyone is subscribed
+ALERTS_STREAM_POLL_INTERVAL = float(os.getenv('ALERTS_STREAM_POLL_INTERVAL', 5))
+# Seconds between keep-alive comments on an idle stream
+ALERTS_STREAM_HEARTBEAT = float(os.getenv('ALERTS_STREAM_HEARTBEAT', 15))
+# Events buffered per subscriber before it is dropped as too slow
+ALERTS_STREAM_QUEUE_SIZE = int(os.getenv('ALERTS_STREAM_QUEUE_SIZE', 16))
+# Concurrent subscribers per process when streams are served asynchronously
+# (asgi.py); threaded servers pass a lower limit to Broadcaster.subscribe
+ALERTS_STREAM_MAX_CLIENTS = int(os.getenv('ALERTS_STREAM_MAX_CLIENTS', 1000))
+
+HEARTBEAT = b': keepalive\n\n'
+
+
+def sse_event(data, event=None, id=None):
+    """One server-sent event; `data` is JSON-encoded onto a single line"""
+    lines = []
+    if id is not None:
+        lines.append(f'id: {id}\n'.encode('utf-8'))
+    if event is not None:
+        lines.append(f'event: {event}\n'.encode('utf-8'))
+    lines.append(b'data: ' + dumps(data).rstrip(b'\n') + b'\n\n')
+    return b''.join(lines)
+
+
+class Subscriber:
+    """One client's bounded buffer of encoded events"""
+
+    def __init__(self, queue_size=ALERTS_STREAM_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.evicted = False
+
+    def put(self, event):
+        """Queue `event`; raises queue.Full if the subscriber is too far behind"""
+        self.queue.put_nowait(event)
+
+    def get(self, timeout):
+        """The next event, or None if nothing arrived within `timeout` seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscriber(Subscriber):
+    """
+    A subscriber on an asyncio event loop: the client awaits its events
+    instead of blocking a thread on the queue.
+    """
+
+    def __init__(self, loop, queue_size=ALERTS_STREAM_QUEUE_SIZE):
+        super().__init__(queue_size)
+        self.loop = loop
+        self._ready = asyncio.Event()
+
+    def put(self, event):
+        # Called from the broadcaster's thread
+        super().put(event)
+        try:
+            self.loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # The loop has closed, so the client is gone: drop it as well
+            raise queue.Full
+
+    async def aget(self, timeout):
+        """The next event, or None if nothing arrived within `timeout` seconds"""
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        # A put after this point schedules set() to run after clear()
+        self._ready.clear()
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+
+class Broadcaster:
+    """
+    Fans events out to any number of subscribers. A watcher thread, started
+    with the first subscription, calls `poll_fn()` every `interval` seconds
+    and publishes each event it returns, so one upstream refresh serves
+    every client. Each event is encoded once and the same bytes are queued
+    for every subscriber; a subscriber whose queue is full is evicted
+    rather than allowed to hold up the others or grow without bound.
+    """
+
+    def __init__(self, poll_fn, interval=ALERTS_STREAM_POLL_INTERVAL, max_clients=ALERTS_STREAM_MAX_CLIENTS,
+                 queue_size=ALERTS_STREAM_QUEUE_SIZE, name='broadcaster'):
+        self.poll_fn = poll_fn
+        self.interval = interval
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self.name = name
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.published = 0
+        self.evicted = 0
+
+    def subscribe(self, max_clients=None, loop=None):
+        """
+        A new Subscriber (an AsyncSubscriber on `loop` if given), or None if
+        `max_clients` (default self.max_clients) are already connected.
+        """
+        with self._lock:
+            limit = self.max_clients if max_clients is None else min(self.max_clients, max_clients)
+            if len(self._subscribers) >= limit:
+                return None
+            if loop is not None:
+                subscriber = AsyncSubscriber(loop, self.queue_size)
+            else:
+                subscriber = Subscriber(self.queue_size)
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        slow = []
+        for subscriber in subscribers:
+            try:
+                subscriber.put(event)
+            except queue.Full:
+                slow.append(subscriber)
+        if slow:
+            with self._lock:
+                for subscriber in slow:
+                    subscriber.evicted = True
+                    self._subscribers.discard(subscriber)
+                self.evicted += len(slow)
+            logger.warning("%s evicted %s slow subscribers", self.name, len(slow))
+        self.published += 1
+
+    def status(self):
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'subscribers': len(self._subscribers),
+            'published': self.published,
+            'evicted': self.evicted
+        }
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            with self._lock:
+                if not self._subscribers:
+                    # Nobody is listening: stop polling until the next subscribe
+                    self._thread = None
+                    return
+            try:
+                event = self.poll_fn()
+                if event is not None:
+                    self.publish(event)
+            except Exception as e:
+                logger.error("Error in %s: %s", self.name, e)
@@ -0,0 +1,378 @@
+# upstream.py
+import asyncio
+import contextlib
+import os
+import logging
+import threading
+import time
+from collections import deque
+import requests
+import metrics
+import urllib3
+from requests.adapters import HTTPAdapter
+
+# Disable SSL warnings
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+logger = logging.getLogger(__name__)
+
+IMD_BASE_URL = os.getenv('IMD_BASE_URL', 'https://mausam.imd.gov.in')
+
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 5))
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', 15))
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 10))
+UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', 2))
+UPSTREAM_BACKOFF = float(os.getenv('UPSTREAM_BACKOFF', 0.5))
+# Seconds one IMD call may take, retries and backoff included. With the
+# wait for a request slot (UPSTREAM_QUEUE_TIMEOUT) this must stay under the
+# server's request timeout (GUNICORN_TIMEOUT)
+UPSTREAM_DEADLINE = float(os.getenv('UPSTREAM_DEADLINE', 25))
+# Responses retried like timeouts and connection errors
+RETRY_STATUSES = frozenset([500, 502, 503, 504])
+
+# Circuit breaker: opens when at least FAILURE_RATE of the last WINDOW calls
+# (and at least MIN_CALLS) failed, then fails fast for OPEN_SECONDS before
+# letting PROBES trial requests through
+UPSTREAM_BREAKER_WINDOW = int(os.getenv('UPSTREAM_BREAKER_WINDOW', 20))
+UPSTREAM_BREAKER_MIN_CALLS = int(os.getenv('UPSTREAM_BREAKER_MIN_CALLS', 10))
+UPSTREAM_BREAKER_FAILURE_RATE = float(os.getenv('UPSTREAM_BREAKER_FAILURE_RATE', 0.5))
+UPSTREAM_BREAKER_OPEN_SECONDS = float(os.getenv('UPSTREAM_BREAKER_OPEN_SECONDS', 30))
+UPSTREAM_BREAKER_PROBES = int(os.getenv('UPSTREAM_BREAKER_PROBES', 1))
+
+# Adaptive concurrency: the limit grows by one per `limit` fast responses and
+# halves on a slow or failed one, staying between MIN and MAX
+UPSTREAM_MIN_CONCURRENCY = int(os.getenv('UPSTREAM_MIN_CONCURRENCY', 1))
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv('UPSTREAM_MAX_CONCURRENCY', UPSTREAM_POOL_SIZE))
+UPSTREAM_TARGET_LATENCY = float(os.getenv('UPSTREAM_TARGET_LATENCY', 3))
+# Seconds a call may wait for a free slot before failing
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', 10))
+
+# Headers to mimic a browser
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling IMD while the breaker is open or no request slot frees up in time"""
+
+
+class CircuitBreaker:
+    """
+    Closed: every call goes through and its outcome is recorded in a
+    rolling window. Open: calls fail fast until `open_seconds` have passed.
+    Half-open: up to `probes` trial calls go through; a success closes the
+    breaker, a failure opens it again.
+    """
+
+    def __init__(self, window=UPSTREAM_BREAKER_WINDOW, min_calls=UPSTREAM_BREAKER_MIN_CALLS,
+                 failure_rate=UPSTREAM_BREAKER_FAILURE_RATE, open_seconds=UPSTREAM_BREAKER_OPEN_SECONDS,
+                 probes=UPSTREAM_BREAKER_PROBES):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.state = 'closed'
+        self.opened_at = None
+        self.times_opened = 0
+        self._outcomes = deque(maxlen=window)
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Returns (allowed, probe): whether a call may go ahead and if it is a half-open trial"""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False, False
+                self.state = 'half-open'
+                logger.info("Upstream circuit half-open, sending trial requests")
+            if self.state == 'half-open':
+                if self._probes_in_flight >= self.probes:
+                    return False, False
+                self._probes_in_flight += 1
+                return True, True
+            return True, False
+
+    def record(self, ok, probe=False):
+        with self._lock:
+            if probe:
+                self._probes_in_flight -= 1
+                if ok:
+                    self.state = 'closed'
+                    self._outcomes.clear()
+                    logger.info("Upstream circuit closed")
+                else:
+                    self._open()
+                return
+            if self.state != 'closed':
+                # Finished after the breaker opened; the probes decide from here
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def cancel(self, probe):
+        """Give back a call allowed by allow() that was never made"""
+        if probe:
+            with self._lock:
+                self._probes_in_flight -= 1
+
+    def _open(self):
+        # Caller holds self._lock
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        logger.warning("Upstream circuit opened for %ss", self.open_seconds)
+
+    def status(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+        return {
+            'state': self.state,
+            'recent_calls': len(outcomes),
+            'recent_failures': outcomes.count(False),
+            'times_opened': self.times_opened,
+            'open_for': round(max(0.0, self.open_seconds - (time.monotonic() - self.opened_at)), 1)
+            if self.state == 'open' else None
+        }
+
+
+class AdaptiveLimiter:
+    """
+    Limits concurrent upstream requests with additive-increase /
+    multiplicative-decrease on observed latency: each response within
+    `target_latency` raises the limit by 1/limit, and a slow or failed one
+    halves it (at most once per `target_latency`, so one burst of slow
+    responses counts as a single signal).
+    """
+
+    def __init__(self, minimum=UPSTREAM_MIN_CONCURRENCY, maximum=UPSTREAM_MAX_CONCURRENCY,
+                 target_latency=UPSTREAM_TARGET_LATENCY, queue_timeout=UPSTREAM_QUEUE_TIMEOUT):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.queue_timeout = queue_timeout
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.rejected = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def _has_slot(self):
+        return self.in_flight < int(self.limit)
+
+    def try_acquire(self):
+        with self._condition:
+            if not self._has_slot():
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self):
+        with self._condition:
+            if not self._condition.wait_for(self._has_slot, self.queue_timeout):
+                self.rejected += 1
+                raise UpstreamUnavailable('Too many requests waiting for IMD')
+            self.in_flight += 1
+
+    async def aacquire(self):
+        deadline = time.monotonic() + self.queue_timeout
+        delay = 0.01
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                with self._condition:
+                    self.rejected += 1
+                raise UpstreamUnavailable('Too many requests waiting for IMD')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+    def release(self, latency, ok):
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if not ok or latency > self.target_latency:
+                if now - self._last_decrease > self.target_latency:
+                    self.limit = max(float(self.minimum), self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def status(self):
+        return {
+            'limit': int(self.limit),
+            'in_flight': self.in_flight,
+            'rejected': self.rejected
+        }
+
+
+breaker = CircuitBreaker()
+limiter = AdaptiveLimiter()
+
+
+class _Call:
+    __slots__ = ('page', 'probe', 'started', 'ok', 'status')
+
+    def __init__(self, page, probe):
+        self.page = page
+        self.probe = probe
+        self.started = time.monotonic()
+        # Left False unless the caller gets a usable response
+        self.ok = False
+        self.status = None
+
+
+def _admit(page):
+    allowed, probe = breaker.allow()
+    if not allowed:
+        metrics.upstream_responses.inc(page, 'unavailable')
+        raise UpstreamUnavailable('IMD is unavailable, circuit breaker is open')
+    return probe
+
+
+def _rejected(page, probe):
+    breaker.cancel(probe)
+    metrics.upstream_responses.inc(page, 'unavailable')
+
+
+def _finish(call):
+    latency = time.monotonic() - call.started
+    limiter.release(latency, call.ok)
+    breaker.record(call.ok, call.probe)
+    metrics.upstream_seconds.observe(latency, call.page)
+    metrics.upstream_responses.inc(call.page, call.status or 'error')
+
+
+@contextlib.contextmanager
+def guarded(page='page'):
+    """
+    Wrap one upstream request in the circuit breaker and concurrency limit.
+    Raises UpstreamUnavailable instead of calling IMD when it is failing or
+    saturated; the caller sets `call.status` and `call.ok` from the response.
+    """
+    probe = _admit(page)
+    try:
+        limiter.acquire()
+    except UpstreamUnavailable:
+        _rejected(page, probe)
+        raise
+    call = _Call(page, probe)
+    try:
+        yield call
+    finally:
+        _finish(call)
+
+
+@contextlib.asynccontextmanager
+async def aguarded(page='page'):
+    """guarded() for coroutines; waiting for a slot does not block the event loop"""
+    probe = _admit(page)
+    try:
+        await limiter.aacquire()
+    except UpstreamUnavailable:
+        _rejected(page, probe)
+        raise
+    call = _Call(page, probe)
+    try:
+        yield call
+    finally:
+        _finish(call)
+
+
+def status():
+    return {
+        'circuit': breaker.status(),
+        'concurrency': limiter.status()
+    }
+
+
+def _build_session():
+    # Retries are made by get(), within the call's deadline
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=UPSTREAM_POOL_SIZE,
+        pool_block=False
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(HEADERS)
+    session.verify = False
+    return session
+
+
+# One keep-alive connection pool shared by every scraper call
+session = _build_session()
+
+
+def url(path):
+    return f'{IMD_BASE_URL}{path}'
+
+
+def get(url, etag=None, last_modified=None, page='page'):
+    """
+    GET `url` through the shared session. When `etag` or `last_modified`
+    from an earlier response are given the request is conditional, and an
+    unchanged page comes back as a bodiless 304. Raises UpstreamUnavailable
+    without calling IMD while the circuit breaker is open. `page` labels
+    the request in metrics.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    deadline = time.monotonic() + UPSTREAM_DEADLINE
+    with guarded(page) as call:
+        response = _get_within(url, headers, deadline)
+        call.status = response.status_code
+        call.ok = response.status_code < 500
+    logger.debug("GET %s -> %s", url, response.status_code)
+    return response
+
+
+def _get_within(url, headers, deadline):
+    """
+    session.get, retried with exponential backoff on RETRY_STATUSES,
+    timeouts and connection errors. No attempt or pause runs past
+    `deadline` (a time.monotonic() value).
+    """
+    attempt = 0
+    while True:
+        remaining = max(deadline - time.monotonic(), 0.001)
+        try:
+            response = session.get(
+                url,
+                headers=headers,
+                timeout=(min(UPSTREAM_CONNECT_TIMEOUT, remaining), min(UPSTREAM_READ_TIMEOUT, remaining))
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if not _backoff(attempt, deadline):
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or not _backoff(attempt, deadline):
+                return response
+            response.close()
+        attempt += 1
+
+
+def _backoff(attempt, deadline):
+    """Sleep before retry number `attempt` + 1; False if retries or time ran out"""
+    pause = UPSTREAM_BACKOFF * 2 ** attempt
+    if attempt >= UPSTREAM_RETRIES or time.monotonic() + pause >= deadline:
+        return False
+    time.sleep(pause)
+    return True
+
+
+def validators(response):
+    """The (etag, last_modified) pair to send with the next request for the same page"""
+    return response.headers.get('ETag'), response.headers.get('Last-Modified')
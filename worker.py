@@ -0,0 +1,177 @@
+# worker.py
+# Scrape worker: fetches and parses IMD pages on a pool of processes and
+# publishes the results to the shared snapshot store. Run it next to web
+# processes started with SCRAPE_MODE=worker, which then only read snapshots.
+#
+#   python worker.py [--processes N] [--once] [--stations 43003,43057]
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import history
+import logs
+import scraper
+import stations
+from cache import is_error_result
+from store import SnapshotStore
+
+logger = logging.getLogger(__name__)
+
+# Processes fetching and parsing pages; each handles one page at a time
+SCRAPE_WORKERS = int(os.getenv('SCRAPE_WORKERS', 4))
+# Seconds between refreshes; keep these below the web tier's
+# WEATHER_CACHE_TTL and ALERTS_REFRESH_INTERVAL so snapshots never go stale
+SCRAPE_WEATHER_INTERVAL = int(os.getenv('SCRAPE_WEATHER_INTERVAL', 600))
+SCRAPE_ALERTS_INTERVAL = int(os.getenv('SCRAPE_ALERTS_INTERVAL', 240))
+
+# Store key the worker reports its progress under, read by /status/refresher
+STATUS_KEY = 'worker:status'
+
+_store = None
+
+
+def _init_process():
+    global _store
+    logs.configure()
+    _store = SnapshotStore()
+
+
+def scrape_station(id):
+    """Fetch, parse and publish one station's weather; returns the error message or None"""
+    data = scraper.get_station_data(id)
+    if is_error_result(data):
+        return data['error']
+    _store.put(f'weather:{id}', data)
+    history.record(id, data)
+    return None
+
+
+def scrape_alerts():
+    """Fetch, parse and publish the nowcast alerts; returns the error message or None"""
+    data = scraper.get_alerts()
+    if is_error_result(data):
+        return data['error']
+    _store.put('alerts', data)
+    return None
+
+
+class ScrapeWorker:
+    """
+    Schedules station and alerts refreshes on a process pool. A page still
+    being scraped when its next refresh falls due is skipped rather than
+    queued twice.
+    """
+
+    def __init__(self, processes=SCRAPE_WORKERS, weather_interval=SCRAPE_WEATHER_INTERVAL,
+                 alerts_interval=SCRAPE_ALERTS_INTERVAL, station_ids=None):
+        self.processes = processes
+        self.weather_interval = weather_interval
+        self.alerts_interval = alerts_interval
+        self.station_ids = station_ids
+        self.store = SnapshotStore()
+        self._stop = threading.Event()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.state = {
+            'pid': os.getpid(),
+            'processes': processes,
+            'started': time.time(),
+            'pages': {}
+        }
+
+    def stop(self):
+        self._stop.set()
+
+    def _keys(self):
+        ids = self.station_ids or [station['stationId'] for station in stations.get_all()]
+        return [('alerts', scrape_alerts, ())] + [(f'weather:{id}', scrape_station, (id,)) for id in ids]
+
+    def _submit(self, pool, key, fn, args):
+        with self._lock:
+            if key in self._pending:
+                return None
+            future = self._pending[key] = pool.submit(fn, *args)
+        started = time.time()
+        future.add_done_callback(lambda future: self._done(key, started, future))
+        return future
+
+    def _done(self, key, started, future):
+        try:
+            error = future.result()
+        except Exception as e:
+            error = str(e)
+        if error:
+            logger.warning("Scraping %s failed: %s", key, error)
+        with self._lock:
+            page = self.state['pages'].setdefault(key, {'last_success': None, 'last_error': None})
+            page['last_attempt'] = started
+            page['duration'] = round(time.time() - started, 3)
+            if error:
+                page['last_error'] = error
+            else:
+                page['last_success'] = time.time()
+                page['last_error'] = None
+            self._pending.pop(key, None)
+
+    def _publish_status(self):
+        with self._lock:
+            status = {**self.state, 'pages': {key: dict(page) for key, page in self.state['pages'].items()}}
+        try:
+            self.store.put(STATUS_KEY, {**status, 'updated': time.time()})
+        except Exception as e:
+            logger.error("Error publishing worker status: %s", e)
+
+    def run(self, once=False):
+        next_due = {}
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(self.processes, mp_context=context, initializer=_init_process) as pool:
+            logger.info("Scrape worker started with %s processes", self.processes)
+            while not self._stop.is_set():
+                now = time.monotonic()
+                futures = []
+                for key, fn, args in self._keys():
+                    if next_due.get(key, 0) > now:
+                        continue
+                    next_due[key] = now + (self.alerts_interval if key == 'alerts' else self.weather_interval)
+                    future = self._submit(pool, key, fn, args)
+                    if future is not None:
+                        futures.append(future)
+                if once:
+                    for future in futures:
+                        future.exception()
+                    break
+                self._publish_status()
+                self._stop.wait(1)
+        self._publish_status()
+        logger.info("Scrape worker stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch and parse IMD pages into the shared snapshot store')
+    parser.add_argument('--processes', type=int, default=SCRAPE_WORKERS, help='scraping processes')
+    parser.add_argument('--weather-interval', type=int, default=SCRAPE_WEATHER_INTERVAL,
+                        help='seconds between refreshes of each station')
+    parser.add_argument('--alerts-interval', type=int, default=SCRAPE_ALERTS_INTERVAL,
+                        help='seconds between refreshes of the alerts')
+    parser.add_argument('--stations', help='comma-separated station IDs (default: every station)')
+    parser.add_argument('--once', action='store_true', help='refresh everything once and exit')
+    args = parser.parse_args()
+
+    logs.configure()
+    stations.load()
+    station_ids = [int(id) for id in args.stations.split(',')] if args.stations else None
+    worker = ScrapeWorker(args.processes, args.weather_interval, args.alerts_interval, station_ids)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    try:
+        worker.run(once=args.once)
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == '__main__':
+    main()